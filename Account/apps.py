@@ -5,3 +5,6 @@ class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Account'
 
+
+    def ready(self):
+        from . import signals  # noqa: F401
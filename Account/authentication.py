@@ -0,0 +1,91 @@
+import copy
+import threading
+import time
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .models import CustomUser, ClaimsUser
+
+# Claims copied into access tokens by CustomTokenObtainPairSerializer.get_token
+USER_CLAIMS = ClaimsUser.CLAIM_FIELDS
+
+# 'claims': build the user from token claims, 'cache': short-lived in-process user cache,
+# 'db': load the user on every request (simplejwt default)
+JWT_USER_MODE = getattr(settings, 'JWT_USER_MODE', 'claims')
+JWT_USER_CACHE_TTL = getattr(settings, 'JWT_USER_CACHE_TTL', 30)
+JWT_USER_CACHE_MAX_ENTRIES = getattr(settings, 'JWT_USER_CACHE_MAX_ENTRIES', 10000)
+
+
+class UserCache:
+    """
+    Per-process {user_id: CustomUser} cache with a short TTL
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        # Views may modify request.user, never hand out the shared instance
+        return copy.copy(entry[1])
+
+    def set(self, user):
+        with self._lock:
+            if len(self._users) >= self.max_entries:
+                self._users.pop(next(iter(self._users)))
+            self._users[user.pk] = (time.monotonic() + self.ttl, copy.copy(user))
+
+    def discard(self, user_id):
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        self._users.clear()
+
+
+user_cache = UserCache(JWT_USER_CACHE_TTL, JWT_USER_CACHE_MAX_ENTRIES)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that avoids loading the user row on every request.
+
+    In 'claims' mode request.user is a ClaimsUser carrying id, user_type, account_status,
+    is_staff and is_superuser from the token; the rest of the row is only read if a view
+    touches another attribute. Tokens issued before the claims existed fall back to the
+    database. In 'cache' mode users are loaded once and kept for JWT_USER_CACHE_TTL seconds.
+    """
+
+    def get_user(self, validated_token):
+        if JWT_USER_MODE == 'claims' and not api_settings.CHECK_REVOKE_TOKEN:
+            user = self.get_claims_user(validated_token)
+            if user is not None:
+                return user
+        elif JWT_USER_MODE == 'cache' and api_settings.USER_ID_CLAIM in validated_token:
+            user = user_cache.get(self.get_user_id(validated_token))
+            if user is None:
+                user = super().get_user(validated_token)
+                user_cache.set(user)
+            return user
+        return super().get_user(validated_token)
+
+    def get_user_id(self, validated_token):
+        # simplejwt stores the id as a string
+        return CustomUser._meta.get_field(api_settings.USER_ID_FIELD).to_python(
+            validated_token[api_settings.USER_ID_CLAIM]
+        )
+
+    def get_claims_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            return None
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return None
+        claims = {claim: validated_token[claim] for claim in USER_CLAIMS}
+        claims[api_settings.USER_ID_FIELD] = self.get_user_id(validated_token)
+        # from_db expects the values in concrete field order
+        field_names = [field.attname for field in ClaimsUser._meta.concrete_fields if field.attname in claims]
+        return ClaimsUser.from_db(None, field_names, [claims[name] for name in field_names])
@@ -0,0 +1,55 @@
+from collections import Counter
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+from .models import CustomUser
+
+FACET_FIELDS = ('specialization', 'hospital', 'clinic')
+FACETS_CACHE_KEY = 'doctor-facets'
+# Cache alias holding the counts; shared by every worker (e.g. Redis) so invalidation reaches them all
+FACETS_CACHE_ALIAS = getattr(settings, 'DOCTOR_FACETS_CACHE_ALIAS', 'default')
+# Upper bound on staleness should the alias be per process (local memory)
+FACETS_CACHE_TIMEOUT = getattr(settings, 'DOCTOR_FACETS_CACHE_TIMEOUT', 300)
+
+
+def compute_doctor_facets():
+    """
+    Counts active doctors per specialization, hospital and clinic with a single GROUP BY.
+    """
+    rows = (
+        CustomUser.objects.filter(user_type='doctor', account_status='active')
+        .values(*FACET_FIELDS)
+        .annotate(doctors=Count('id'))
+        .order_by()
+    )
+    counters = {field: Counter() for field in FACET_FIELDS}
+    for row in rows:
+        for field in FACET_FIELDS:
+            if row[field]:
+                counters[field][row[field]] += row['doctors']
+    return {
+        f'{field}s': [
+            {'name': name, 'count': count}
+            for name, count in sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        for field, counter in counters.items()
+    }
+
+
+def facets_cache():
+    return caches[FACETS_CACHE_ALIAS]
+
+
+def get_doctor_facets():
+    facets = facets_cache().get(FACETS_CACHE_KEY)
+    if facets is None:
+        facets = compute_doctor_facets()
+        facets_cache().set(FACETS_CACHE_KEY, facets, FACETS_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_doctor_facets():
+    facets_cache().delete(FACETS_CACHE_KEY)
+    # Again after commit, so a read racing the transaction can't re-cache stale counts
+    transaction.on_commit(lambda: facets_cache().delete(FACETS_CACHE_KEY))
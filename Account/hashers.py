@@ -0,0 +1,34 @@
+"""
+Password hashers whose cost is tuned per environment with the PASSWORD_HASHING setting.
+
+The first hasher of PASSWORD_HASHERS (PASSWORD_HASHER in settings) hashes new passwords; the
+others only verify existing hashes. After a successful check_password() Django rehashes the
+password with the first hasher when the algorithm or its parameters differ (must_update), so
+a policy change reaches every active user at their next login, without a migration.
+
+Argon2 needs the argon2-cffi package.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+POLICY = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+def _param(algorithm, name, default):
+    return POLICY.get(algorithm, {}).get(name, default)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = _param('scrypt', 'work_factor', hashers.ScryptPasswordHasher.work_factor)
+    block_size = _param('scrypt', 'block_size', hashers.ScryptPasswordHasher.block_size)
+    parallelism = _param('scrypt', 'parallelism', hashers.ScryptPasswordHasher.parallelism)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = _param('argon2', 'time_cost', hashers.Argon2PasswordHasher.time_cost)
+    memory_cost = _param('argon2', 'memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+    parallelism = _param('argon2', 'parallelism', hashers.Argon2PasswordHasher.parallelism)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = _param('pbkdf2', 'iterations', hashers.PBKDF2PasswordHasher.iterations)
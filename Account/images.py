@@ -0,0 +1,209 @@
+"""
+Uploaded ID images: review thumbnails and reference counts.
+
+Uploads are only queued here (IdImageJob, see signals.py); the process_id_images worker
+decodes them and writes small progressive JPEGs next to the originals, so requests never
+pay for image processing and the admin review screen downloads a fraction of the bytes.
+
+The originals are stored once per content (Account.storage) and shared between users.
+signals.py keeps StoredImage.refcount in step with the rows, and the worker deletes the
+files nobody references any more. Thumbnails belong to one row and go with it.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import CustomUser, IdImageJob, StoredImage
+
+THUMBNAIL_FIELDS = {
+    'face_id_image': 'face_id_thumbnail',
+    'back_id_image': 'back_id_thumbnail',
+}
+ID_IMAGE_FIELDS = tuple(THUMBNAIL_FIELDS)
+# Bounding box and JPEG quality of the thumbnails
+THUMBNAIL_SIZE = getattr(settings, 'ID_THUMBNAIL_SIZE', (640, 640))
+THUMBNAIL_QUALITY = getattr(settings, 'ID_THUMBNAIL_QUALITY', 70)
+IMAGE_JOB_MAX_ATTEMPTS = getattr(settings, 'ID_IMAGE_JOB_MAX_ATTEMPTS', 3)
+# How long a claimed job is left to its worker before another one may take it over
+IMAGE_JOB_CLAIM_SECONDS = getattr(settings, 'ID_IMAGE_JOB_CLAIM_SECONDS', 300)
+# How long an unreferenced file is kept, so an upload that was just deduplicated against it
+# has time to save the row pointing at it
+IMAGE_PRUNE_GRACE = timedelta(seconds=getattr(settings, 'ID_IMAGE_PRUNE_GRACE_SECONDS', 600))
+
+
+def make_thumbnail(file):
+    """
+    Returns a ContentFile with a JPEG of file scaled down to fit THUMBNAIL_SIZE.
+    """
+    with Image.open(file) as image:
+        # JPEG decoders can scale by 1/2 to 1/8 while decoding, much cheaper than a full decode
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    return ContentFile(output.getvalue())
+
+
+def thumbnail_name(source):
+    return os.path.splitext(os.path.basename(source))[0] + '.jpg'
+
+
+def enqueue_thumbnails(user, fields):
+    """
+    Queues thumbnails for the given ID image fields of user that hold a file.
+    """
+    jobs = [
+        IdImageJob(user=user, field=field, source=getattr(user, field).name)
+        for field in fields if getattr(user, field)
+    ]
+    return IdImageJob.objects.bulk_create(jobs)
+
+
+def claim_image_jobs(batch_size=20):
+    """
+    Marks up to batch_size pending jobs as processing, for IMAGE_JOB_CLAIM_SECONDS, and returns them.
+    Committed before any image is decoded, so no lock or transaction is held meanwhile.
+    A claim that runs out (the worker died) makes the job pending again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            IdImageJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='processing', claimed_until__lte=now))
+            .order_by('id')[:batch_size]
+        )
+        claimed_until = now + timedelta(seconds=IMAGE_JOB_CLAIM_SECONDS)
+        IdImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status='processing', claimed_until=claimed_until)
+    return jobs
+
+
+def process_pending_images(batch_size=20):
+    """
+    Makes the thumbnails of up to batch_size pending jobs, saving each result on its own.
+    Returns (done, failed) counts.
+    """
+    done = failed = 0
+    jobs = claim_image_jobs(batch_size)
+    if not jobs:
+        return done, failed
+    users = CustomUser.objects.only('id', *ID_IMAGE_FIELDS, *THUMBNAIL_FIELDS.values()).in_bulk(
+        {job.user_id for job in jobs}
+    )
+    for job in jobs:
+        try:
+            _make_job_thumbnail(job, users.get(job.user_id))
+        except Exception as e:
+            job.attempts += 1
+            job.last_error = str(e)
+            if job.attempts >= IMAGE_JOB_MAX_ATTEMPTS:
+                job.status = 'failed'
+                failed += 1
+            else:
+                job.status = 'pending'
+            job.save(update_fields=['status', 'attempts', 'last_error'])
+        else:
+            job.status = 'done'
+            job.attempts += 1
+            job.processed_at = timezone.now()
+            job.save(update_fields=['status', 'attempts', 'processed_at'])
+            done += 1
+    return done, failed
+
+
+def _make_job_thumbnail(job, user):
+    if user is None or getattr(user, job.field).name != job.source:
+        # The user is gone or uploaded another image, which has its own job
+        return
+    image = getattr(user, job.field)
+    thumbnail = getattr(user, THUMBNAIL_FIELDS[job.field])
+    previous = thumbnail.name
+    with image.open('rb'):
+        content = make_thumbnail(image)
+    thumbnail.save(thumbnail_name(job.source), content, save=False)
+    # Only if the image is still the one the thumbnail was made from; no save() so no signals fire
+    updated = CustomUser.objects.filter(pk=user.pk, **{job.field: job.source}).update(
+        **{THUMBNAIL_FIELDS[job.field]: thumbnail.name}
+    )
+    if not updated:
+        thumbnail.storage.delete(thumbnail.name)
+    elif previous and previous != thumbnail.name:
+        thumbnail.storage.delete(previous)
+
+
+def delete_thumbnails(names):
+    """
+    Deletes thumbnail files once the transaction commits. Unlike the originals they are never
+    shared: every user gets its own file (see _make_job_thumbnail).
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    storage = CustomUser._meta.get_field('face_id_thumbnail').storage
+
+    def delete():
+        for name in names:
+            storage.delete(name)
+
+    transaction.on_commit(delete)
+
+
+def acquire_images(names):
+    """
+    Adds a reference to every stored image name (a name may be given more than once).
+    """
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    now = timezone.now()
+    StoredImage.objects.bulk_create([StoredImage(name=name, updated_at=now) for name in counts], ignore_conflicts=True)
+    for name, count in counts.items():
+        StoredImage.objects.filter(name=name).update(refcount=F('refcount') + count, updated_at=now)
+
+
+def release_images(names):
+    """
+    Drops a reference to every stored image name; files are deleted later by prune_unreferenced_images.
+    """
+    now = timezone.now()
+    for name, count in Counter(name for name in names if name).items():
+        StoredImage.objects.filter(name=name).update(refcount=Greatest(F('refcount') - count, 0), updated_at=now)
+
+
+def prune_unreferenced_images(grace=IMAGE_PRUNE_GRACE, batch_size=100):
+    """
+    Deletes up to batch_size files that have been unreferenced for longer than grace.
+    Returns the number of files deleted.
+    """
+    cutoff = timezone.now() - grace
+    storage = CustomUser._meta.get_field('face_id_image').storage
+    candidates = list(
+        StoredImage.objects.filter(refcount=0, updated_at__lt=cutoff)
+        .order_by('updated_at').values_list('pk', flat=True)[:batch_size]
+    )
+    pruned = 0
+    for pk in candidates:
+        with transaction.atomic():
+            # Locked and checked again: rows may have referenced it since, and uploads of the same
+            # content take this lock before reusing the file (ContentAddressedStorage.save)
+            image = (
+                StoredImage.objects.select_for_update(skip_locked=True)
+                .filter(pk=pk, refcount=0, updated_at__lt=cutoff).first()
+            )
+            if image is None:
+                continue
+            if storage.exists(image.name):
+                if storage.get_modified_time(image.name) >= cutoff:
+                    # Just deduplicated against by an upload whose row is not saved yet
+                    continue
+                storage.delete(image.name)
+            image.delete()
+            pruned += 1
+    return pruned
@@ -0,0 +1,38 @@
+import os
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+from Appointment.benchmarking import time_call
+
+
+class Command(BaseCommand):
+    help = ('Time one password hash with each configured hasher (PASSWORD_HASHERS) and report hashes per '
+            'second per core, to size the workers serving logins')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--algorithm', action='append', help='Only these algorithms (repeatable)')
+
+    def handle(self, *args, **options):
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        self.stdout.write(f'{cores} cores available')
+        for index, hasher in enumerate(get_hashers()):
+            if options['algorithm'] and hasher.algorithm not in options['algorithm']:
+                continue
+            label = hasher.algorithm + (' (preferred)' if index == 0 else '')
+            try:
+                encoded = hasher.encode('Bench@Passw0rd', hasher.salt())
+            except ValueError as e:
+                # Library not installed, e.g. argon2-cffi
+                self.stdout.write(self.style.WARNING(f'{label}: unavailable ({e})'))
+                continue
+            params = {
+                key: value for key, value in hasher.decode(encoded).items()
+                if key not in ('algorithm', 'hash', 'salt')
+            }
+            # One login is one verification, which costs the same as one hash
+            stats = time_call(lambda: hasher.verify('Bench@Passw0rd', encoded), runs=options['runs'])
+            per_core = stats['throughput_per_s']
+            self.stdout.write(self.style.SUCCESS(label))
+            self.stdout.write(f"  {', '.join(f'{key}={value}' for key, value in params.items())}")
+            self.stdout.write(f"  p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+            self.stdout.write(f"  {per_core} hashes/s per core, ~{round(per_core * cores, 1)}/s on {cores} cores")
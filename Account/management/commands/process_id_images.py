@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from Account.images import process_pending_images, prune_unreferenced_images
+
+
+class Command(BaseCommand):
+    help = (
+        'Make review thumbnails of uploaded ID images and delete the ones no user references '
+        '(use --loop to keep running as a worker)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new images')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = process_pending_images(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'Made {done} thumbnail(s), {failed} failed')
+            pruned = prune_unreferenced_images(batch_size=options['batch_size'])
+            if pruned:
+                self.stdout.write(f'Deleted {pruned} unreferenced image(s)')
+            if not options['loop']:
+                break
+            # Drain the queue batch after batch, sleep only once it is empty
+            if not (done or failed or pruned):
+                time.sleep(options['interval'])
@@ -0,0 +1,187 @@
+"""
+Serving of ID images (national ID scans), which are never public.
+
+Image URLs given to the admin screen and to the image owner carry an expiring signature
+(sign_image_url), since <img> tags can't send the JWT. The expiry is rounded so a URL stays
+the same for a while and browsers can reuse their cached copy.
+
+The transfer itself is handed to the web server with X-Sendfile or X-Accel-Redirect when
+MEDIA_SENDFILE is set. Otherwise a FileResponse streams the file, through the server's
+wsgi.file_wrapper (sendfile) where available, with ETag, Last-Modified and single Range support.
+"""
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+from django.conf import settings
+from django.core.signing import Signer
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
+from .storage import ContentAddressedStorage
+
+# Seconds a signed image URL stays valid, at least
+ID_IMAGE_URL_TTL = getattr(settings, 'ID_IMAGE_URL_TTL', 3600)
+# None, 'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect' (nginx)
+MEDIA_SENDFILE = getattr(settings, 'MEDIA_SENDFILE', None)
+# nginx `internal` location serving MEDIA_ROOT, for X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_LOCATION = getattr(settings, 'MEDIA_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+# Read size when the file is streamed by Django itself
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+_signer = Signer(salt='Account.media.id-image')
+
+
+def _signature(name, expires):
+    return _signer.signature(f'{name}:{expires}')
+
+
+def sign_image_url(url, name, now=None):
+    """
+    Appends an expiring signature for the stored file name to its url.
+    """
+    now = int(time.time() if now is None else now)
+    # Valid for one to two TTLs: within a TTL window every URL of a file is the same
+    expires = (now // ID_IMAGE_URL_TTL + 2) * ID_IMAGE_URL_TTL
+    return f"{url}?{urlencode({'expires': expires, 'signature': _signature(name, expires)})}"
+
+
+def has_valid_signature(request, name):
+    try:
+        expires = int(request.GET['expires'])
+        signature = request.GET['signature']
+    except (KeyError, ValueError):
+        return False
+    return expires >= time.time() and constant_time_compare(signature, _signature(name, expires))
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Returns (first byte, last byte) of a single `bytes=` range, or None to send the whole file
+    (no, malformed or multiple ranges). Raises RangeNotSatisfiable.
+    """
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash or not (first.isdigit() or first == '') or not (last.isdigit() or last == '') or first == last == '':
+        return None
+    if first == '':
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = int(last) if last else size - 1
+    if first >= size or last < first:
+        raise RangeNotSatisfiable
+    return first, min(last, size - 1)
+
+
+class _FileRange:
+    """
+    read() limited to one range of an open file. fileno() is kept so servers can still
+    sendfile() it: they send from the current offset for Content-Length bytes.
+    """
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def content_digest(storage, name):
+    """
+    The SHA-256 of a file stored by ContentAddressedStorage, taken from its name; None for
+    other storages (thumbnails are named after their source image, not their own content).
+    """
+    digest = os.path.splitext(os.path.basename(name))[0]
+    if isinstance(storage, ContentAddressedStorage) and CONTENT_DIGEST.match(digest):
+        return digest
+    return None
+
+
+def file_etag(digest, stat):
+    if digest is not None:
+        return quote_etag(digest)
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def serve_file(request, storage, name):
+    """
+    Response sending the stored file name, 304/412 for conditional requests, 206/416 for ranges.
+    Raises FileNotFoundError.
+    """
+    path = storage.path(name)
+    stat = os.stat(path)
+    digest = content_digest(storage, name)
+    etag = file_etag(digest, stat)
+    last_modified = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if MEDIA_SENDFILE:
+        # The web server does the transfer (and ranges); Python only checked access
+        response = HttpResponse(content_type=content_type)
+        if MEDIA_SENDFILE == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = MEDIA_ACCEL_REDIRECT_LOCATION + quote(name)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        response = _file_response(request, path, stat.st_size, etag, last_modified, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if digest is not None:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'private, max-age={ID_IMAGE_URL_TTL}'
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range in (etag, http_date(last_modified))):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        first, last = byte_range
+        response = FileResponse(_FileRange(file, first, last - first + 1), status=206, content_type=content_type)
+        response['Content-Length'] = last - first + 1
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response.block_size = BLOCK_SIZE
+    return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Account', '0005_alter_customuser_user_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['user_type', 'specialization'], name='user_type_specialization_idx'),
+        ),
+    ]
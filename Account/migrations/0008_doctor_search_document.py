@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:37
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+SEARCH_INDEX = 'doctor_search_document_trgm_idx'
+
+
+def create_search_index(apps, schema_editor):
+    # GIN trigram indexes only exist on PostgreSQL; other backends use the Python fallback search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('Account', 'CustomUser')._meta.db_table)
+    schema_editor.execute(
+        f"CREATE INDEX {SEARCH_INDEX} ON {table} USING gin (search_document gin_trgm_ops) "
+        f"WHERE user_type = 'doctor'"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Account', '0007_claimsuser'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='customuser',
+            name='search_document',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Concat('full_name', models.Value(' '), 'specialization', models.Value(' '), 'hospital', models.Value(' '), 'clinic')), output_field=models.TextField()),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
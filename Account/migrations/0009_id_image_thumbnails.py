@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Account', '0008_doctor_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='back_id_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='id_images/thumbnails/back/'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='face_id_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='id_images/thumbnails/face/'),
+        ),
+        migrations.CreateModel(
+            name='IdImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('face_id_image', 'Face ID image'), ('back_id_image', 'Back ID image')], max_length=20)),
+                ('source', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='id_image_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['id'], name='id_image_job_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:52
+
+import Account.storage
+import django.utils.timezone
+from collections import Counter
+from django.db import migrations, models
+
+
+def count_existing_images(apps, schema_editor):
+    # Images uploaded before deduplication keep their names and are reference counted too
+    CustomUser = apps.get_model('Account', 'CustomUser')
+    StoredImage = apps.get_model('Account', 'StoredImage')
+    counts = Counter()
+    for names in CustomUser.objects.values_list('face_id_image', 'back_id_image').iterator():
+        counts.update(name for name in names if name)
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=name, refcount=refcount) for name, refcount in counts.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Account', '0009_id_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='back_id_image',
+            field=models.ImageField(blank=True, null=True, storage=Account.storage.ContentAddressedStorage(), upload_to='id_images/back/'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='face_id_image',
+            field=models.ImageField(blank=True, null=True, storage=Account.storage.ContentAddressedStorage(), upload_to='id_images/face/'),
+        ),
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['updated_at'], name='stored_image_unreferenced_idx')],
+            },
+        ),
+        migrations.RunPython(count_existing_images, migrations.RunPython.noop),
+    ]
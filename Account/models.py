@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.core.validators import RegexValidator, EmailValidator
 from django.utils import timezone
 from datetime import timedelta
 from datetime import date
+from .storage import ContentAddressedStorage
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, national_id, password, **extra_fields):
@@ -64,8 +67,21 @@ class CustomUser(AbstractBaseUser):
     heart_disease = models.BooleanField(default=False, blank=True)
     allergies = models.JSONField(default=list, blank=True)
     other_diseases = models.TextField(blank=True)
-    face_id_image = models.ImageField(upload_to='id_images/face/', null=True, blank=True)
-    back_id_image = models.ImageField(upload_to='id_images/back/', null=True, blank=True)
+    # Deduplicated by content, see StoredImage
+    face_id_image = models.ImageField(upload_to='id_images/face/', storage=ContentAddressedStorage(), null=True, blank=True)
+    back_id_image = models.ImageField(upload_to='id_images/back/', storage=ContentAddressedStorage(), null=True, blank=True)
+    # Compressed copies for the admin review screen, written by the process_id_images worker
+    face_id_thumbnail = models.ImageField(upload_to='id_images/thumbnails/face/', null=True, blank=True, editable=False)
+    back_id_thumbnail = models.ImageField(upload_to='id_images/thumbnails/back/', null=True, blank=True, editable=False)
+
+    # Text matched by Account.search.search_doctors, trigram indexed on PostgreSQL
+    search_document = models.GeneratedField(
+        expression=Lower(Concat(
+            'full_name', Value(' '), 'specialization', Value(' '), 'hospital', Value(' '), 'clinic'
+        )),
+        output_field=models.TextField(),
+        db_persist=True,
+    )
 
     otp = models.CharField(max_length=6, blank=True, null=True)
     otp_created_at = models.DateTimeField(blank=True, null=True)
@@ -83,6 +99,12 @@ class CustomUser(AbstractBaseUser):
         choices=ACCOUNT_STATUS_CHOICES,
         default='pending'
     )
+    class Meta:
+        indexes = [
+            # Doctor/pharmacist directories and the specialization filter
+            models.Index(fields=['user_type', 'specialization'], name='user_type_specialization_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -90,3 +112,93 @@ class CustomUser(AbstractBaseUser):
 
 
 
+
+
+class ClaimsUser(CustomUser):
+    """
+    CustomUser built from JWT claims by Account.authentication.ClaimsJWTAuthentication.
+    Only the claim fields are set; touching any other field loads the rest of the row in one query.
+    """
+    # Copied into access tokens by Account.serializers.CustomTokenObtainPairSerializer.get_token
+    CLAIM_FIELDS = ('user_type', 'account_status', 'is_staff', 'is_superuser')
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # The claim fields hold the token's values, which may be older than the row
+        # (an admin rejected or demoted the user since): never write them back
+        if update_fields is None:
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+            ]
+        update_fields = [name for name in update_fields if name not in self.CLAIM_FIELDS]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            # A deferred attribute was read: load every missing column at once
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
+class IdImageJob(models.Model):
+    """
+    An uploaded ID image waiting for its review thumbnail, made by the process_id_images worker
+    """
+    FIELD_CHOICES = [
+        ('face_id_image', 'Face ID image'),
+        ('back_id_image', 'Back ID image'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='id_image_jobs')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    # Name of the image the job was queued for; a newer upload supersedes it
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # End of a worker's claim on a 'processing' job; past it the job is picked up again
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The worker only ever looks at pending jobs and claims that may have run out
+            models.Index(
+                fields=['id'], condition=models.Q(status__in=['pending', 'processing']), name='id_image_job_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.field} of user {self.user_id} ({self.status})"
+
+
+class StoredImage(models.Model):
+    """
+    Number of user ID image fields pointing at a content-addressed file (Account.storage).
+    Files left unreferenced are deleted by the process_id_images worker after a grace period.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The worker only ever looks at unreferenced files
+            models.Index(fields=['updated_at'], condition=models.Q(refcount=0), name='stored_image_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
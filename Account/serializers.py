@@ -1,7 +1,12 @@
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
 from rest_framework import serializers
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
 from .models import CustomUser
+from .media import sign_image_url
 from Prescription.models import Prescription
 
 class CustomUserSerializer(serializers.ModelSerializer):
@@ -9,15 +14,24 @@ class CustomUserSerializer(serializers.ModelSerializer):
     back_id_image = serializers.ImageField(required=False, allow_null=True)
     class Meta:
         model = CustomUser
-        fields = '__all__'
+        exclude = ['search_document', 'face_id_thumbnail', 'back_id_thumbnail']
         extra_kwargs = {
             'password': {'write_only': True},
+            # Without the per-field UniqueValidator query, see validate()
+            'national_id': {'validators': CustomUser._meta.get_field('national_id').validators},
             'phone_number': {'validators': []},
             'email': {'validators': []},
             'face_id_image': {'required': False, 'allow_null': True},
             'back_id_image': {'required': False, 'allow_null': True},
         }
 
+    # Checked together in validate(), in one query, and mapped from IntegrityError on a race
+    UNIQUE_FIELDS = {
+        'national_id': "National ID already exists.",
+        'phone_number': "Phone number already exists.",
+        'email': "Email already exists.",
+    }
+
     def validate_password(self, value):
         from core.validators import validate_password_strength
         
@@ -27,27 +41,45 @@ class CustomUserSerializer(serializers.ModelSerializer):
         
         return value
 
-    def validate_national_id(self, value):
-        if CustomUser.objects.filter(national_id=value).exists():
-            raise serializers.ValidationError("National ID already exists.")
-        return value
-
-    def validate_phone_number(self, value):
-        if CustomUser.objects.filter(phone_number=value).exists():
-            raise serializers.ValidationError("Phone number already exists.")
-        return value
-
-    def validate_email(self, value):
-        if CustomUser.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email already exists.")
-        return value
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        errors = self.uniqueness_errors(attrs)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def uniqueness_errors(self, attrs):
+        values = {field: attrs[field] for field in self.UNIQUE_FIELDS if attrs.get(field)}
+        if not values:
+            return {}
+        lookup = Q()
+        for field, value in values.items():
+            lookup |= Q(**{field: value})
+        taken = CustomUser.objects.filter(lookup)
+        if self.instance is not None:
+            taken = taken.exclude(pk=self.instance.pk)
+        errors = {}
+        for row in taken.values(*values):
+            for field, value in values.items():
+                if row[field] == value:
+                    errors[field] = [self.UNIQUE_FIELDS[field]]
+        return errors
 
     def create(self, validated_data):
         password = validated_data.pop('password', None)
-        user = CustomUser.objects.create(**validated_data)
+        user = CustomUser(**validated_data)
         if password:
+            # Hashed before the INSERT: one write instead of an INSERT and an UPDATE
             user.set_password(password)
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+        except IntegrityError:
+            # Another registration took the value between validate() and the INSERT
+            errors = self.uniqueness_errors(validated_data)
+            if not errors:
+                raise
+            raise serializers.ValidationError(errors)
         return user
 
     def to_representation(self, instance):
@@ -67,6 +99,11 @@ class CustomUserSerializer(serializers.ModelSerializer):
         for field in fields_to_remove:
             representation.pop(field, None)
 
+        # Only the owner gets this representation: sign the image URLs for their <img> tags
+        for field in ('face_id_image', 'back_id_image'):
+            if representation.get(field):
+                representation[field] = sign_image_url(representation[field], getattr(instance, field).name)
+
         return representation
 
 
@@ -80,6 +117,11 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        # Read by Account.authentication.ClaimsJWTAuthentication instead of loading the user
+        token['user_type'] = user.user_type
+        token['account_status'] = user.account_status
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
         return token
 
     def validate(self, attrs):
@@ -87,14 +129,27 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         password = attrs.get('password')
 
         user = User.objects.filter(national_id=national_id).first()
-        if user is None or not user.check_password(password):
+        if user is None:
+            # Hash anyway, as ModelBackend does, so the response time doesn't tell whether the ID exists
+            User().set_password(password)
+            raise serializers.ValidationError('Invalid credentials')
+        # Rehashes with the current PASSWORD_HASHERS policy when the stored hash is outdated
+        if not user.check_password(password):
             raise serializers.ValidationError('Invalid credentials')
         if user.account_status != 'active':
             raise serializers.ValidationError('Account is not active. Please wait for admin verification.')
 
-        data = super().validate(attrs)
-        data.update({'user_type': user.user_type})
-        return data
+        # The tokens are built here rather than by super().validate(), whose authenticate() call
+        # would hash the password a second time
+        self.user = user
+        refresh = self.get_token(user)
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+        return {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user_type': user.user_type,
+        }
 
 
 class RequestPasswordResetSerializer(serializers.Serializer):
@@ -131,7 +186,11 @@ class NestedPrescriptionSerializer(serializers.ModelSerializer):
 
 
 class PatientSerializer(serializers.ModelSerializer):
-    prescriptions = NestedPrescriptionSerializer(many=True, read_only=True)
+    # Only the latest prescriptions are embedded; the full history is paginated at
+    # patients/<national_id>/prescriptions/history/
+    RECENT_PRESCRIPTIONS = 10
+
+    prescriptions = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
@@ -140,29 +199,45 @@ class PatientSerializer(serializers.ModelSerializer):
             'diabetes', 'heart_disease', 'allergies', 'other_diseases', 'prescriptions'
         ]
 
-
+    @staticmethod
+    def setup_eager_loading(queryset, prescription_limit=RECENT_PRESCRIPTIONS):
+        """
+        Prefetches the latest prescription_limit prescriptions of every patient, with their doctor,
+        in one query
+        """
+        prescriptions = Prescription.objects.select_related('doctor').only(
+            'patient', 'doctor', 'medicine_name', 'dosage', 'instructions', 'created_at', 'doctor__full_name'
+        ).order_by('-created_at', '-id')[:prescription_limit]
+        # A sliced prefetch can only be stored in its own attribute
+        return queryset.prefetch_related(Prefetch('prescriptions', queryset=prescriptions, to_attr='loaded_prescriptions'))
+
+    def get_prescriptions(self, patient):
+        prescriptions = getattr(patient, 'loaded_prescriptions', None)
+        if prescriptions is None:
+            prescriptions = patient.prescriptions.select_related('doctor')[:self.RECENT_PRESCRIPTIONS]
+        return NestedPrescriptionSerializer(prescriptions, many=True).data
+
+
+class PatientBatchLookupSerializer(serializers.Serializer):
+    national_ids = serializers.ListField(
+        child=serializers.CharField(max_length=14), min_length=1, max_length=300
+    )
+    prescription_limit = serializers.IntegerField(
+        required=False, min_value=0, max_value=PatientSerializer.RECENT_PRESCRIPTIONS
+    )
+
+
+# Public directories: ID images are only for staff and their owner (Account.views.serve_id_image)
 class DoctorSerializer(serializers.ModelSerializer):
-    face_id_image = serializers.ImageField(required=False, allow_null=True)
-    back_id_image = serializers.ImageField(required=False, allow_null=True)
-
     class Meta:
         model = CustomUser
-        fields = [
-            'email', 'phone_number', 'full_name', 'hospital', 'specialization', 'clinic',
-            'face_id_image', 'back_id_image'
-        ]
+        fields = ['email', 'phone_number', 'full_name', 'hospital', 'specialization', 'clinic']
 
 
 class PharmacistSerializer(serializers.ModelSerializer):
-    face_id_image = serializers.ImageField(required=False, allow_null=True)
-    back_id_image = serializers.ImageField(required=False, allow_null=True)
-
     class Meta:
         model = CustomUser
-        fields = [
-            'full_name', 'phone_number', 'email', 'pharmacy_name', 'pharmacy_address',
-            'face_id_image', 'back_id_image'
-        ]
+        fields = ['full_name', 'phone_number', 'email', 'pharmacy_name', 'pharmacy_address']
 
         from rest_framework import serializers
 from .models import CustomUser
@@ -177,6 +252,13 @@ class AccountStatusUpdateSerializer(serializers.ModelSerializer):
 
 
 class AdminUserListSerializer(serializers.ModelSerializer):
+    """
+    ID images are returned as their review thumbnails, or as the originals with ?images=original.
+    An image whose thumbnail is not made yet is returned as the original.
+    """
+    face_id_image = serializers.SerializerMethodField()
+    back_id_image = serializers.SerializerMethodField()
+
     class Meta:
         model = CustomUser
         fields = [
@@ -185,21 +267,16 @@ class AdminUserListSerializer(serializers.ModelSerializer):
         ]
 
     def get_face_id_image(self, obj):
-        request = self.context.get('request')
-        if obj.face_id_image and hasattr(obj.face_id_image, 'url'):
-            url = obj.face_id_image.url
-            # Ensure /media/ is in the URL
-            if not url.startswith('/media/'):
-                url = '/media' + url if not url.startswith('/') else '/media' + url
-            return request.build_absolute_uri(url) if request else url
-        return None
+        return self._image_url(obj.face_id_image, obj.face_id_thumbnail)
 
     def get_back_id_image(self, obj):
+        return self._image_url(obj.back_id_image, obj.back_id_thumbnail)
+
+    def _image_url(self, image, thumbnail):
+        if not image:
+            return None
         request = self.context.get('request')
-        if obj.back_id_image and hasattr(obj.back_id_image, 'url'):
-            url = obj.back_id_image.url
-            # Ensure /media/ is in the URL
-            if not url.startswith('/media/'):
-                url = '/media' + url if not url.startswith('/') else '/media' + url
-            return request.build_absolute_uri(url) if request else url
-        return None
+        wants_original = request is not None and request.query_params.get('images') == 'original'
+        file = image if wants_original or not thumbnail else thumbnail
+        url = sign_image_url(file.url, file.name)
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,119 @@
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import CustomUser, ClaimsUser
+from .authentication import user_cache
+from .facets import FACET_FIELDS, invalidate_doctor_facets
+from .images import (
+    ID_IMAGE_FIELDS, THUMBNAIL_FIELDS, enqueue_thumbnails, acquire_images, release_images, delete_thumbnails,
+)
+
+FACET_STATE_FIELDS = ('user_type', 'account_status', *FACET_FIELDS)
+
+
+def _facet_state(user):
+    if user.pk is None or user.get_deferred_fields() & set(FACET_STATE_FIELDS):
+        # Reading a deferred field here would cost a query per row (e.g. ClaimsUser)
+        return None
+    return tuple(getattr(user, field) for field in FACET_STATE_FIELDS)
+
+
+def _id_image_names(user):
+    if user.get_deferred_fields() & set(ID_IMAGE_FIELDS):
+        return None
+    # Raw attribute values: going through the descriptors would build a FieldFile per row loaded
+    values = {field: user.__dict__.get(field) for field in ID_IMAGE_FIELDS}
+    return {field: getattr(value, 'name', value) for field, value in values.items()}
+
+
+def _stored_id_images(user):
+    """
+    Names of user's ID images in the database, loaded in one query when the instance doesn't know them.
+    """
+    if getattr(user, '_loaded_id_images', None) is None:
+        stored = CustomUser.objects.filter(pk=user.pk).values(*ID_IMAGE_FIELDS).first()
+        user._loaded_id_images = stored or {}
+    return user._loaded_id_images
+
+
+def _counts_in_facets(state):
+    user_type, account_status = state[:2]
+    return user_type == 'doctor' and account_status == 'active'
+
+
+def _touches_id_images(update_fields):
+    return update_fields is None or bool(set(update_fields) & set(ID_IMAGE_FIELDS))
+
+
+# ClaimsUser is a proxy, its signals are sent with ClaimsUser as sender
+@receiver(post_init, sender=CustomUser)
+@receiver(post_init, sender=ClaimsUser)
+def remember_loaded_state(sender, instance, **kwargs):
+    instance._loaded_facet_state = _facet_state(instance)
+    instance._loaded_id_images = _id_image_names(instance)
+
+
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=ClaimsUser)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    if not instance._state.adding and _touches_id_images(update_fields):
+        # Instances loaded without the image columns (ClaimsUser) need the replaced names
+        _stored_id_images(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=ClaimsUser)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    user_cache.discard(instance.pk)
+    new_state = _facet_state(instance)
+    old_state = getattr(instance, '_loaded_facet_state', None)
+    if created:
+        changed = new_state is None or _counts_in_facets(new_state)
+    elif old_state is None or new_state is None:
+        changed = True
+    else:
+        changed = old_state != new_state and (_counts_in_facets(old_state) or _counts_in_facets(new_state))
+    if changed:
+        invalidate_doctor_facets()
+    instance._loaded_facet_state = new_state
+
+    if _touches_id_images(update_fields):
+        id_images_saved(instance, created)
+
+
+def id_images_saved(user, created):
+    """
+    Moves the references of replaced ID images to the new files and queues their thumbnails.
+    """
+    new_names = _id_image_names(user)
+    if new_names is None:
+        return
+    old_names = {} if created else getattr(user, '_loaded_id_images', None) or {}
+    changed = [field for field, name in new_names.items() if name != old_names.get(field)]
+    if changed:
+        release_images(old_names.get(field) for field in changed)
+        acquire_images(new_names[field] for field in changed)
+        enqueue_thumbnails(user, changed)
+    user._loaded_id_images = new_names
+
+
+@receiver(pre_delete, sender=CustomUser)
+@receiver(pre_delete, sender=ClaimsUser)
+def user_deleting(sender, instance, **kwargs):
+    _stored_id_images(instance)
+    thumbnail_fields = tuple(THUMBNAIL_FIELDS.values())
+    if instance.get_deferred_fields() & set(thumbnail_fields):
+        stored = CustomUser.objects.filter(pk=instance.pk).values_list(*thumbnail_fields).first()
+        instance._deleted_thumbnails = stored or ()
+    else:
+        instance._deleted_thumbnails = tuple(getattr(instance, field).name for field in thumbnail_fields)
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=ClaimsUser)
+def user_deleted(sender, instance, **kwargs):
+    user_cache.discard(instance.pk)
+    state = _facet_state(instance)
+    if state is None or _counts_in_facets(state):
+        invalidate_doctor_facets()
+    release_images((getattr(instance, '_loaded_id_images', None) or {}).values())
+    delete_thumbnails(getattr(instance, '_deleted_thumbnails', ()))
@@ -0,0 +1,42 @@
+import hashlib
+import os
+import posixpath
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file once, named after the SHA-256 of its content, in the directory Django
+    picked for it: id_images/face/photo.jpg becomes id_images/face/3f/3fa4...c1.jpg.
+    Saving content that is already stored writes nothing and returns the existing name.
+
+    Files are shared between rows: they are reference counted with Account.models.StoredImage
+    and only deleted by Account.images.prune_unreferenced_images.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+
+        directory, filename = posixpath.split(name)
+        name = posixpath.join(directory, digest[:2], digest + os.path.splitext(filename)[1].lower())
+        with transaction.atomic():
+            # prune_unreferenced_images deletes the file under this row lock: either it is gone
+            # (and written again below) or its fresh mtime keeps it from being pruned
+            StoredImage = apps.get_model('Account', 'StoredImage')
+            list(StoredImage.objects.select_for_update().filter(name=name).values_list('pk'))
+            if self.exists(name):
+                # Fresh mtime: keeps the file from being pruned before the row pointing at it is saved
+                os.utime(self.path(name))
+                return name
+        return super().save(name, content, max_length=max_length)
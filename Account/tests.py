@@ -1,3 +1,526 @@
-from django.test import TestCase
+import hashlib
+import os
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from PIL import Image
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import ClaimsJWTAuthentication, user_cache
+from .facets import FACETS_CACHE_KEY, facets_cache, get_doctor_facets
+from .hashers import ScryptPasswordHasher
+from .images import claim_image_jobs, process_pending_images, prune_unreferenced_images, thumbnail_name
+from .media import sign_image_url
+from .models import CustomUser, IdImageJob, StoredImage
+from .serializers import CustomTokenObtainPairSerializer, CustomUserSerializer
+from Prescription.models import Prescription
+from core.testing import TemporaryMediaRootMixin, create_user
 
-# Create your tests here.
+
+class DirectoryPaginationTests(TestCase):
+    def setUp(self):
+        for index in range(1, 6):
+            create_user(index, 'doctor', specialization='Cardiology')
+        create_user(50, 'pharmacist')
+        self.client = APIClient()
+
+    def test_doctor_list_is_paginated_by_name(self):
+        response = self.client.get(reverse('doctor-list'), {'page_size': 3})
+        self.assertEqual([row['full_name'] for row in response.data['results']], ['User 001', 'User 002', 'User 003'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['full_name'] for row in response.data['results']], ['User 004', 'User 005'])
+        self.assertIsNone(response.data['next'])
+        # Public: ID images are only served to staff and their owner
+        self.assertNotIn('face_id_image', response.data['results'][0])
+
+    def test_pharmacist_list_count(self):
+        response = self.client.get(reverse('pharmacist-list'), {'count': '1'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.doctor = create_user(1, 'doctor', specialization='Cardiology')
+        self.token = CustomTokenObtainPairSerializer.get_token(self.doctor).access_token
+
+    def test_login_token_carries_user_claims(self):
+        response = APIClient().post(reverse('token_obtain_pair'), {
+            'national_id': self.doctor.national_id, 'password': 'Passw0rd!'
+        })
+        token = AccessToken(response.data['access'])
+        self.assertEqual(token['user_type'], 'doctor')
+        self.assertEqual(token['account_status'], 'active')
+        self.assertFalse(token['is_staff'])
+
+    def test_user_built_from_claims_without_queries(self):
+        with self.assertNumQueries(0):
+            user = ClaimsJWTAuthentication().get_user(self.token)
+            self.assertEqual(user.pk, self.doctor.pk)
+            self.assertEqual(user.user_type, 'doctor')
+            self.assertFalse(user.is_staff)
+
+        # The rest of the row is loaded once, on first use
+        with self.assertNumQueries(1):
+            self.assertEqual(user.full_name, self.doctor.full_name)
+            self.assertEqual(user.specialization, 'Cardiology')
+            self.assertEqual(user.national_id, self.doctor.national_id)
+
+    def test_tokens_without_claims_fall_back_to_database(self):
+        token = AccessToken.for_user(self.doctor)
+        with self.assertNumQueries(1):
+            user = ClaimsJWTAuthentication().get_user(token)
+        self.assertEqual(user.full_name, self.doctor.full_name)
+
+    def test_authenticated_request(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.get(reverse('doctor-appointments'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_mode(self):
+        authentication = ClaimsJWTAuthentication()
+        with patch('Account.authentication.JWT_USER_MODE', 'cache'):
+            with self.assertNumQueries(1):
+                authentication.get_user(self.token)
+                user = authentication.get_user(self.token)
+            self.assertEqual(user.full_name, self.doctor.full_name)
+
+            self.doctor.full_name = 'Renamed'
+            self.doctor.save()
+            self.assertEqual(authentication.get_user(self.token).full_name, 'Renamed')
+
+    def test_profile_update_keeps_newer_status_and_flags(self):
+        CustomUser.objects.filter(pk=self.doctor.pk).update(is_staff=True)
+        token = CustomTokenObtainPairSerializer.get_token(CustomUser.objects.get(pk=self.doctor.pk)).access_token
+        # Demoted and rejected by an admin after the token was issued
+        CustomUser.objects.filter(pk=self.doctor.pk).update(is_staff=False, account_status='rejected')
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = client.put(reverse('user-profile'), {'address': 'Giza'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.address, 'Giza')
+        self.assertFalse(self.doctor.is_staff)
+        self.assertEqual(self.doctor.account_status, 'rejected')
+
+
+class DoctorFacetsTests(TestCase):
+    def setUp(self):
+        facets_cache().clear()
+        self.cardiologist = create_user(1, 'doctor', specialization='Cardiology', hospital='Nile', clinic='A')
+        create_user(2, 'doctor', specialization='Cardiology', hospital='Delta')
+        create_user(3, 'doctor', specialization='Neurology', hospital='Nile', account_status='pending')
+        create_user(4, 'patient')
+
+    def test_counts_active_doctors(self):
+        response = APIClient().get(reverse('doctor-facets'))
+        self.assertEqual(response.data, {
+            'specializations': [{'name': 'Cardiology', 'count': 2}],
+            'hospitals': [{'name': 'Delta', 'count': 1}, {'name': 'Nile', 'count': 1}],
+            'clinics': [{'name': 'A', 'count': 1}],
+        })
+
+    def test_cached_until_a_doctor_changes(self):
+        with self.assertNumQueries(1):
+            get_doctor_facets()
+            get_doctor_facets()
+        # In the configured (shared) alias, not the per-process default cache
+        self.assertIsNotNone(caches[settings.DOCTOR_FACETS_CACHE_ALIAS].get(FACETS_CACHE_KEY))
+        self.assertIsNone(caches['default'].get(FACETS_CACHE_KEY))
+
+        create_user(5, 'patient')
+        with self.assertNumQueries(0):
+            get_doctor_facets()
+
+        self.cardiologist.specialization = 'Dermatology'
+        self.cardiologist.save()
+        self.assertEqual(
+            [row['name'] for row in get_doctor_facets()['specializations']], ['Cardiology', 'Dermatology']
+        )
+
+        pending = CustomUser.objects.get(national_id=f'{3:014d}')
+        pending.account_status = 'active'
+        pending.save()
+        self.assertEqual(len(get_doctor_facets()['specializations']), 3)
+
+        pending.delete()
+        self.assertEqual(len(get_doctor_facets()['specializations']), 2)
+
+
+class PatientBatchLookupTests(TestCase):
+    def setUp(self):
+        self.doctors = [create_user(index, 'doctor') for index in (1, 2)]
+        self.patients = [create_user(index, 'patient') for index in range(10, 15)]
+        for patient in self.patients:
+            for number, doctor in enumerate(self.doctors * 2):
+                Prescription.objects.create(
+                    patient=patient, doctor=doctor, medicine_name=f'Medicine {number}', dosage='1', instructions='-'
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(create_user(3, 'pharmacist'))
+        self.url = reverse('search-patients')
+
+    def test_batch_in_two_queries(self):
+        national_ids = [patient.national_id for patient in self.patients] + ['99999999999999']
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'national_ids': national_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results']), {patient.national_id for patient in self.patients})
+        self.assertEqual(response.data['not_found'], ['99999999999999'])
+        prescriptions = response.data['results'][self.patients[0].national_id]['prescriptions']
+        self.assertEqual(len(prescriptions), 4)
+        self.assertEqual({row['doctor'] for row in prescriptions}, {'User 001', 'User 002'})
+
+    def test_prescription_limit_keeps_the_latest(self):
+        response = self.client.post(self.url, {
+            'national_ids': [self.patients[0].national_id, self.patients[1].national_id], 'prescription_limit': 2
+        }, format='json')
+        for patient in response.data['results'].values():
+            self.assertEqual([row['medicine_name'] for row in patient['prescriptions']], ['Medicine 3', 'Medicine 2'])
+
+    def test_limits_and_permissions(self):
+        response = self.client.post(self.url, {'national_ids': [f'{index:014d}' for index in range(301)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(self.patients[0])
+        response = self.client.post(self.url, {'national_ids': [self.patients[1].national_id]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_single_patient_search_is_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('search-patient', args=[self.patients[0].national_id]))
+        self.assertEqual(len(response.data['prescriptions']), 4)
+
+
+def jpeg_upload(name, size=(2400, 1600)):
+    output = BytesIO()
+    Image.effect_noise(size, 60).convert('RGB').save(output, 'JPEG', quality=95)
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+class IdImagePipelineTests(TemporaryMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def register_doctor(self):
+        response = self.client.post(reverse('user-register'), {
+            'national_id': '00000000000021', 'password': 'Passw0rd!', 'email': 'doctor21@example.com',
+            'phone_number': '01000000021', 'full_name': 'User 021', 'gender': 'male', 'birthday': '1985-05-05',
+            'address': 'Cairo', 'user_type': 'doctor', 'specialization': 'Cardiology',
+            'face_id_image': jpeg_upload('face.jpg'), 'back_id_image': jpeg_upload('back.jpg'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return CustomUser.objects.get(national_id='00000000000021')
+
+    def test_upload_queues_thumbnails_for_the_worker(self):
+        user = self.register_doctor()
+        self.assertEqual(
+            sorted(IdImageJob.objects.filter(status='pending').values_list('field', flat=True)),
+            ['back_id_image', 'face_id_image']
+        )
+        self.assertFalse(user.face_id_thumbnail)
+
+        call_command('process_id_images', stdout=StringIO())
+
+        user.refresh_from_db()
+        self.assertFalse(IdImageJob.objects.exclude(status='done').exists())
+        with Image.open(user.face_id_thumbnail.path) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 640)
+        self.assertLess(user.face_id_thumbnail.size * 10, user.face_id_image.size)
+
+        admin = create_user(1, 'doctor', is_staff=True)
+        self.client.force_authenticate(admin)
+        row = next(row for row in self.client.get(reverse('admin-user-list')).data['results'] if row['id'] == user.id)
+        self.assertTrue(row['face_id_image'].split('?')[0].endswith(user.face_id_thumbnail.url))
+        row = next(
+            row for row in self.client.get(reverse('admin-user-list'), {'images': 'original'}).data['results']
+            if row['id'] == user.id
+        )
+        self.assertTrue(row['face_id_image'].split('?')[0].endswith(user.face_id_image.url))
+
+    def test_replaced_image_supersedes_its_job(self):
+        user = self.register_doctor()
+        user.face_id_image = jpeg_upload('face2.jpg', size=(800, 600))
+        user.save()
+        self.assertEqual(IdImageJob.objects.filter(field='face_id_image').count(), 2)
+
+        call_command('process_id_images', stdout=StringIO())
+
+        user.refresh_from_db()
+        self.assertTrue(user.face_id_thumbnail.name.startswith(
+            'id_images/thumbnails/face/' + thumbnail_name(user.face_id_image.name)[:-len('.jpg')]
+        ))
+        # Unchanged images are not queued again
+        user.save()
+        self.assertFalse(IdImageJob.objects.filter(status='pending').exists())
+
+    def test_thumbnails_are_deleted_with_the_user(self):
+        user = self.register_doctor()
+        call_command('process_id_images', stdout=StringIO())
+        user.refresh_from_db()
+        thumbnails = [user.face_id_thumbnail.path, user.back_id_thumbnail.path]
+        self.assertTrue(all(os.path.exists(path) for path in thumbnails))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # Loaded without the image columns, like ClaimsUser
+            CustomUser.objects.only('id').get(pk=user.pk).delete()
+        self.assertFalse(any(os.path.exists(path) for path in thumbnails))
+
+    def test_abandoned_claims_are_taken_over(self):
+        self.register_doctor()
+        # A worker claimed the jobs and died
+        self.assertEqual(len(claim_image_jobs()), 2)
+        self.assertEqual(process_pending_images(), (0, 0))
+
+        IdImageJob.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_pending_images(), (2, 0))
+        self.assertFalse(IdImageJob.objects.exclude(status='done').exists())
+
+    def test_broken_image_fails_after_retries(self):
+        user = self.register_doctor()
+        with open(user.back_id_image.path, 'wb') as broken:
+            broken.write(b'not an image')
+
+        for _ in range(3):
+            call_command('process_id_images', stdout=StringIO())
+
+        job = IdImageJob.objects.get(field='back_id_image')
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertEqual(IdImageJob.objects.get(field='face_id_image').status, 'done')
+
+
+class ContentAddressedImageTests(TemporaryMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        upload = jpeg_upload('face.jpg', size=(300, 200))
+        self.content = upload.read()
+
+    def upload(self, name='copy.JPG'):
+        return SimpleUploadedFile(name, self.content, content_type='image/jpeg')
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, names in os.walk(self.media_root) for name in names
+        )
+
+    def test_same_content_is_stored_once(self):
+        first = create_user(1, 'doctor', face_id_image=self.upload('face.jpg'))
+        second = create_user(2, 'doctor', face_id_image=self.upload(), back_id_image=self.upload())
+
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(first.face_id_image.name, f'id_images/face/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second.face_id_image.name, first.face_id_image.name)
+        self.assertEqual(self.stored_files(), [
+            f'id_images/back/{digest[:2]}/{digest}.jpg', f'id_images/face/{digest[:2]}/{digest}.jpg'
+        ])
+        self.assertEqual(StoredImage.objects.get(name=first.face_id_image.name).refcount, 2)
+
+    def test_files_are_pruned_once_unreferenced(self):
+        first = create_user(1, 'doctor', face_id_image=self.upload())
+        second = create_user(2, 'doctor', face_id_image=self.upload())
+        name = first.face_id_image.name
+
+        # Loaded without the image columns, like ClaimsUser
+        CustomUser.objects.only('id').get(pk=first.pk).delete()
+        self.assertEqual(StoredImage.objects.get(name=name).refcount, 1)
+        self.assertEqual(prune_unreferenced_images(grace=timedelta(0)), 0)
+
+        second.face_id_image = jpeg_upload('other.jpg', size=(100, 100))
+        second.save()
+        self.assertEqual(StoredImage.objects.get(name=name).refcount, 0)
+        self.assertEqual(prune_unreferenced_images(), 0)  # Still within the grace period
+        self.assertTrue(second.face_id_image.storage.exists(name))
+
+        with patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+            self.assertEqual(prune_unreferenced_images(), 1)
+        self.assertFalse(second.face_id_image.storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+        self.assertTrue(second.face_id_image.storage.exists(second.face_id_image.name))
+
+        # The same content uploaded again after the prune is stored again
+        third = create_user(3, 'doctor', face_id_image=self.upload())
+        self.assertEqual(third.face_id_image.name, name)
+        self.assertTrue(third.face_id_image.storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).refcount, 1)
+
+
+class IdImageServingTests(TemporaryMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = create_user(1, 'doctor', face_id_image=jpeg_upload('face.jpg', size=(200, 100)))
+        self.admin = create_user(2, 'doctor', is_staff=True)
+        self.other = create_user(3, 'patient')
+        self.image = self.owner.face_id_image
+        self.content = self.image.read()
+        self.image.close()
+        self.client = APIClient()
+
+    def get(self, user=None, url=None, **headers):
+        if user is not None:
+            headers['Authorization'] = f'Bearer {AccessToken.for_user(user)}'
+        response = self.client.get(url or self.image.url, headers=headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+        return response
+
+    def test_only_staff_and_owner(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get(self.other).status_code, 403)
+        self.assertEqual(self.get(self.owner).body, self.content)
+
+        response = self.get(self.admin)
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(self.get(self.admin, url='/media/id_images/../../../etc/passwd').status_code, 404)
+
+    def test_signed_urls(self):
+        self.assertEqual(self.get(url=sign_image_url(self.image.url, self.image.name)).body, self.content)
+        self.assertEqual(self.get(url=sign_image_url(self.image.url, 'id_images/face/other.jpg')).status_code, 401)
+        expired = sign_image_url(self.image.url, self.image.name, now=timezone.now().timestamp() - 3 * 3600)
+        self.assertEqual(self.get(url=expired).status_code, 401)
+
+        self.client.force_authenticate(self.admin)
+        row = next(row for row in self.client.get(reverse('admin-user-list')).data['results'] if row['id'] == self.owner.id)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get(url=row['face_id_image']).body, self.content)
+
+    def test_conditional_and_range_requests(self):
+        etag = self.get(self.admin)['ETag']
+        self.assertEqual(self.get(self.admin, If_None_Match=etag).status_code, 304)
+
+        response = self.get(self.admin, Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        self.assertEqual(self.get(self.admin, Range='bytes=-5').body, self.content[-5:])
+        self.assertEqual(self.get(self.admin, Range='bytes=5-').body, self.content[5:])
+        self.assertEqual(self.get(self.admin, Range=f'bytes={len(self.content)}-').status_code, 416)
+        # Stale If-Range and multiple ranges get the whole file
+        self.assertEqual(self.get(self.admin, Range='bytes=0-1', If_Range='"stale"').status_code, 200)
+        self.assertEqual(self.get(self.admin, Range='bytes=0-1,4-5').body, self.content)
+
+    def test_transfer_handed_to_the_web_server(self):
+        with patch('Account.media.MEDIA_SENDFILE', 'x-accel-redirect'):
+            response = self.get(self.admin)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.image.name}')
+        self.assertEqual(response.content, b'')
+
+        with patch('Account.media.MEDIA_SENDFILE', 'x-sendfile'):
+            response = self.get(self.admin)
+        self.assertEqual(response['X-Sendfile'], self.image.path)
+
+    def test_thumbnails_are_not_treated_as_content_addressed(self):
+        call_command('process_id_images', stdout=StringIO())
+        self.owner.refresh_from_db()
+        thumbnail = self.owner.face_id_thumbnail
+        # Named after the source image, whose hash is not the thumbnail's
+        self.assertEqual(thumbnail_name(self.image.name), os.path.basename(thumbnail.name))
+
+        response = self.get(self.admin, url=thumbnail.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(hashlib.sha256(self.content).hexdigest(), response['ETag'])
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
+        self.assertEqual(self.get(self.admin, url=thumbnail.url, If_None_Match=response['ETag']).status_code, 304)
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.data = {
+            'national_id': '00000000000077', 'password': 'Passw0rd!', 'email': 'user77@example.com',
+            'phone_number': '00000000077', 'full_name': 'User 077', 'gender': 'female',
+            'birthday': '1990-01-01', 'address': 'Cairo', 'user_type': 'patient',
+        }
+
+    def test_one_lookup_and_one_insert(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('user-register'), self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        statements = [query['sql'] for query in captured if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[1].startswith('INSERT'))
+
+        user = CustomUser.objects.get(national_id='00000000000077')
+        self.assertTrue(user.check_password('Passw0rd!'))
+        self.assertEqual(user.account_status, 'active')
+
+    def test_every_taken_field_is_reported(self):
+        create_user(77, 'patient')
+        response = self.client.post(reverse('user-register'), self.data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['message'], 'National ID already exists., Phone number already exists., Email already exists.'
+        )
+
+        response = self.client.post(reverse('user-register'), dict(self.data, national_id='123'), format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unique_constraint_race_is_a_field_error(self):
+        create_user(78, 'patient')
+        # As if the other registration committed after validate()
+        with patch.object(CustomUserSerializer, 'validate', lambda self, attrs: attrs):
+            response = self.client.post(reverse('user-register'), dict(self.data, email='user78@example.com'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'Email already exists.')
+        self.assertFalse(CustomUser.objects.filter(national_id='00000000000077').exists())
+
+    def test_profile_update_keeps_own_values(self):
+        user = create_user(79, 'patient')
+        self.client.force_authenticate(user)
+        response = self.client.put(reverse('user-profile'), {'email': user.email, 'address': 'Giza'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['Account.hashers.ScryptPasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'])
+class PasswordHashingTests(TestCase):
+    def login(self, user):
+        return APIClient().post(reverse('token_obtain_pair'), {'national_id': user.national_id, 'password': 'Passw0rd!'})
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        user = create_user(90, 'patient')
+        CustomUser.objects.filter(pk=user.pk).update(password=make_password('Passw0rd!', hasher='md5'))
+
+        self.assertEqual(self.login(user).status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, 'scrypt')
+        self.assertEqual(self.login(user).status_code, 200)
+
+    def test_new_parameters_are_applied_on_login(self):
+        user = create_user(91, 'patient')
+        with patch.object(ScryptPasswordHasher, 'work_factor', 2 ** 12):
+            self.assertEqual(self.login(user).status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(ScryptPasswordHasher().decode(user.password)['work_factor'], 2 ** 12)
+
+    def test_login_hashes_once(self):
+        user = create_user(92, 'patient')
+        with patch.object(ScryptPasswordHasher, 'verify', autospec=True, side_effect=ScryptPasswordHasher.verify) as verify:
+            response = self.login(user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_password_hashers', runs=1, algorithm=['scrypt'], stdout=out)
+        self.assertIn('scrypt (preferred)', out.getvalue())
+        self.assertIn('hashes/s per core', out.getvalue())
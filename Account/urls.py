@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import UserRegistrationView, UserProfileView
 from Account.views import SetNewPasswordView,CustomTokenObtainPairView,RequestPasswordResetView,VerifyOTPView,PatientSearchView,DoctorListView,PharmacistListView
+from .views import DoctorFacetsView, PatientBatchLookupView
 from .views import AccountStatusUpdateView
 from .views import AdminUserListView
 
@@ -10,9 +11,11 @@ urlpatterns = [
     path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('request-password-reset/', RequestPasswordResetView.as_view(), name='request_password_reset'),
     path('verify-otp/', VerifyOTPView.as_view(), name='verify_otp'),
+    path('search-patients/', PatientBatchLookupView.as_view(), name='search-patients'),
     path('search-patient/<str:national_id>/', PatientSearchView.as_view(), name='search-patient'),
     path('set-new-password/', SetNewPasswordView.as_view(), name='set_new_password'),
     path('doctors-categories/', DoctorListView.as_view(), name='doctor-list'),
+    path('doctors-facets/', DoctorFacetsView.as_view(), name='doctor-facets'),
     path('pharmacists-categories/', PharmacistListView.as_view(), name='pharmacist-list'),
     path('admin/account-status/<int:id>/', AccountStatusUpdateView.as_view(), name='account-status-update'),
     path('admin/users/', AdminUserListView.as_view(), name='admin-user-list'),
@@ -1,6 +1,6 @@
 from rest_framework import status, permissions, serializers
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.core.mail import send_mail
+from Outbox.utils import enqueue_mail
 from django.utils.crypto import get_random_string
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -16,6 +16,7 @@ from .serializers import (
     VerifyOTPSerializer,
     SetNewPasswordSerializer,
     PatientSerializer,
+    PatientBatchLookupSerializer,
     DoctorSerializer,
     PharmacistSerializer
 )
@@ -23,27 +24,43 @@ from .models import CustomUser
 from rest_framework import generics, permissions
 from .models import CustomUser
 from .serializers import AccountStatusUpdateSerializer
-from django.core.mail import send_mail
 from django.conf import settings
 from rest_framework import generics, permissions
 from .models import CustomUser
 from .serializers import AdminUserListSerializer
+from core.pagination import KeysetPagination
+from .facets import get_doctor_facets
+from .media import has_valid_signature, serve_file
+from .authentication import ClaimsJWTAuthentication
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 # User Registration View
 class UserRegistrationView(APIView):
     def post(self, request):
-        data = request.data.copy()
-        # Automatically activate patients
-        if data.get('user_type') == 'patient':
-            data['account_status'] = 'active'
-        serializer = CustomUserSerializer(data=data)
+        # No request.data.copy(): it deep-copies the uploaded ID images
+        serializer = CustomUserSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response({"status": "User created"}, status=status.HTTP_201_CREATED)
+            try:
+                # Automatically activate patients
+                if serializer.validated_data['user_type'] == 'patient':
+                    serializer.save(account_status='active')
+                else:
+                    serializer.save()
+            except serializers.ValidationError as e:
+                # Lost a race for a unique value, see CustomUserSerializer.create
+                errors = e.detail
+            else:
+                return Response({"status": "User created"}, status=status.HTTP_201_CREATED)
         else:
-            error_messages = [error for errors in serializer.errors.values() for error in errors]
-            message = ', '.join(error_messages)
-            return Response({"message": message}, status=status.HTTP_400_BAD_REQUEST)
+            errors = serializer.errors
+        error_messages = [error for field_errors in errors.values() for error in field_errors]
+        message = ', '.join(error_messages)
+        return Response({"message": message}, status=status.HTTP_400_BAD_REQUEST)
 
 # Custom Token Obtain Pair View
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -93,12 +110,11 @@ class RequestPasswordResetView(APIView):
             user.otp_created_at = timezone.now()
             user.save()
 
-            send_mail(
+            enqueue_mail(
                 'Password Reset OTP',
                 f'Your OTP for password reset is {otp}.',
                 settings.EMAIL_HOST_USER,
                 [email],
-                fail_silently=False,
             )
 
             return Response({'status': 'OTP sent to email.'}, status=status.HTTP_200_OK)
@@ -155,22 +171,65 @@ class PatientSearchView(APIView):
         if request.user.user_type not in ['doctor', 'pharmacist']:
             return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
 
-        patient = get_object_or_404(CustomUser, national_id=national_id, user_type='patient')
+        patient = get_object_or_404(
+            PatientSerializer.setup_eager_loading(CustomUser.objects.all()), national_id=national_id, user_type='patient'
+        )
         serializer = PatientSerializer(patient)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class PatientBatchLookupView(APIView):
+    """
+    Looks up to 300 patients by national ID in two queries, e.g. for a pharmacy queue.
+    Results are keyed by national ID; prescription_limit lowers the number of recent prescriptions.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.user.user_type not in ['doctor', 'pharmacist']:
+            return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = PatientBatchLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        national_ids = list(dict.fromkeys(serializer.validated_data['national_ids']))
+
+        patients = PatientSerializer.setup_eager_loading(
+            CustomUser.objects.filter(national_id__in=national_ids, user_type='patient'),
+            prescription_limit=serializer.validated_data.get('prescription_limit', PatientSerializer.RECENT_PRESCRIPTIONS)
+        )
+        results = {patient.national_id: PatientSerializer(patient).data for patient in patients}
+        return Response({
+            'results': results,
+            'not_found': [national_id for national_id in national_ids if national_id not in results],
+        }, status=status.HTTP_200_OK)
+
 # Doctor and Pharmacist List Views
 class DoctorListView(APIView):
+    keyset_ordering = ('full_name', 'id')
+
     def get(self, request):
         doctors = CustomUser.objects.filter(user_type='doctor')
-        serializer = DoctorSerializer(doctors, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(doctors, request, view=self)
+        serializer = DoctorSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class DoctorFacetsView(APIView):
+    """
+    Specializations, hospitals and clinics of active doctors with doctor counts,
+    for the directory filters
+    """
+    def get(self, request):
+        return Response(get_doctor_facets())
 
 class PharmacistListView(APIView):
+    keyset_ordering = ('full_name', 'id')
+
     def get(self, request):
         pharmacists = CustomUser.objects.filter(user_type='pharmacist')
-        serializer = PharmacistSerializer(pharmacists, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(pharmacists, request, view=self)
+        serializer = PharmacistSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -188,22 +247,20 @@ class AccountStatusUpdateView(generics.UpdateAPIView):
         instance = serializer.save()
         # If status changed to active, send email
         if old_status != 'active' and instance.account_status == 'active':
-            send_mail(
+            enqueue_mail(
                 subject='Your CareSync. account is activated',
                 message='Congratulations! Your account has been activated by the admin. You can now log in and use the platform.',
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[instance.email],
-                fail_silently=True,
             )
         # If status changed to rejected, send rejection email and delete user
         elif old_status != 'rejected' and instance.account_status == 'rejected':
             email = user.email
-            send_mail(
+            enqueue_mail(
                 subject='Your CareSync account was rejected',
                 message='Sorry, your account was rejected because some data is not valid. Please try again with valid data.',
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=True,
             )
             user.delete()
         else:
@@ -213,7 +270,38 @@ class AdminUserListView(generics.ListAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = AdminUserListSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    keyset_ordering = ('-id',)
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
-        return context
\ No newline at end of file
+        return context
+
+
+@require_safe
+def serve_id_image(request, path):
+    """
+    Sends an ID image or its thumbnail to staff and to its owner, authenticated by the JWT
+    header or by a signed URL (see Account.media)
+    """
+    name = f'id_images/{path}'
+    if not has_valid_signature(request, name):
+        try:
+            result = ClaimsJWTAuthentication().authenticate(request)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            result = None
+        if result is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        user = result[0]
+        owns_image = CustomUser.objects.filter(pk=user.pk).filter(
+            Q(face_id_image=name) | Q(back_id_image=name) | Q(face_id_thumbnail=name) | Q(back_id_thumbnail=name)
+        ).exists()
+        if not (user.is_staff or user.is_superuser or owns_image):
+            return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+    # Originals are content-addressed, thumbnails are in the default storage
+    field = 'face_id_thumbnail' if name.startswith('id_images/thumbnails/') else 'face_id_image'
+    storage = CustomUser._meta.get_field(field).storage
+    try:
+        return serve_file(request, storage, name)
+    except (FileNotFoundError, IsADirectoryError, SuspiciousFileOperation):
+        raise Http404
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DoctorSchedule, Appointment, DoctorDayOff
+from .models import DoctorSchedule, Appointment, DoctorDayOff, DoctorSlot
 
 
 @admin.register(DoctorSchedule)
@@ -42,3 +42,11 @@ class DoctorDayOffAdmin(admin.ModelAdmin):
     list_filter = ['date']
     search_fields = ['doctor__full_name', 'reason']
     ordering = ['-date']
+
+
+@admin.register(DoctorSlot)
+class DoctorSlotAdmin(admin.ModelAdmin):
+    list_display = ['doctor', 'date', 'time', 'state']
+    list_filter = ['state', 'date']
+    search_fields = ['doctor__full_name']
+    ordering = ['-date', 'time']
@@ -0,0 +1,169 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+from django.db.models import Q
+from .models import DoctorSchedule, Appointment, DoctorDayOff
+
+
+def _date_range(start_date, end_date):
+    current_date = start_date
+    while current_date <= end_date:
+        yield current_date
+        current_date += timedelta(days=1)
+
+
+def load_schedules(doctor_ids, start_date, end_date):
+    """
+    Returns {(doctor_id, date): schedule} for every day in the range that has a schedule.
+    Week-specific schedules win over recurring ones, same as DoctorSchedule.get_schedule_for_date.
+    """
+    schedules = DoctorSchedule.objects.filter(doctor_id__in=doctor_ids).filter(
+        Q(is_recurring=True) |
+        Q(
+            is_recurring=False,
+            week_start_date__gte=DoctorSchedule.week_start_for(start_date),
+            week_start_date__lte=DoctorSchedule.week_start_for(end_date),
+        )
+    ).order_by('week_start_date', 'day_of_week', 'start_time')
+
+    recurring = {}
+    week_specific = {}
+    for schedule in schedules:
+        if schedule.is_recurring:
+            # Keep the first one in model ordering, like .first() does
+            recurring.setdefault((schedule.doctor_id, schedule.day_of_week), schedule)
+        else:
+            week_specific.setdefault((schedule.doctor_id, schedule.day_of_week, schedule.week_start_date), schedule)
+
+    resolved = {}
+    for doctor_id in doctor_ids:
+        for current_date in _date_range(start_date, end_date):
+            day_of_week = current_date.weekday()
+            schedule = week_specific.get((doctor_id, day_of_week, DoctorSchedule.week_start_for(current_date)))
+            if schedule is None:
+                schedule = recurring.get((doctor_id, day_of_week))
+            if schedule is not None:
+                resolved[(doctor_id, current_date)] = schedule
+    return resolved
+
+
+def load_days_off(doctor_ids, start_date, end_date):
+    """
+    Returns {(doctor_id, date): DoctorDayOff} for the range.
+    """
+    days_off = DoctorDayOff.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    )
+    return {(day_off.doctor_id, day_off.date): day_off for day_off in days_off}
+
+
+def load_booked_times(doctor_ids, start_date, end_date):
+    """
+    Returns {(doctor_id, date): set of booked times} for active appointments in the range.
+    """
+    booked = defaultdict(set)
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_date__gte=start_date,
+        appointment_date__lte=end_date,
+        status__in=Appointment.ACTIVE_STATUSES
+    ).values_list('doctor_id', 'appointment_date', 'appointment_time')
+    for doctor_id, appointment_date, appointment_time in rows:
+        booked[(doctor_id, appointment_date)].add(appointment_time)
+    return booked
+
+
+def build_day_data(current_date, schedule, day_off, booked_times):
+    """
+    Builds the per-day dict returned by the availability endpoint.
+    """
+    day_data = {
+        'date': current_date.isoformat(),
+        'day_name': current_date.strftime('%A'),
+        'is_available': False,
+        'slots': [],
+        'reason_unavailable': None
+    }
+
+    if day_off:
+        day_data['reason_unavailable'] = day_off.reason or 'Day off'
+    elif schedule and schedule.is_working_day:
+        day_data['is_available'] = True
+        day_data['slots'] = schedule.get_available_slots(current_date, booked_times=booked_times)
+        day_data['working_hours'] = {
+            'start': schedule.start_time.strftime('%H:%M'),
+            'end': schedule.end_time.strftime('%H:%M')
+        }
+    else:
+        day_data['reason_unavailable'] = 'Not a working day'
+
+    return day_data
+
+
+def build_availability(doctor_ids, start_date, end_date):
+    """
+    Computes availability for several doctors over a date range in three queries
+    (schedules, days off, booked slots), whatever the length of the range.
+    Returns {doctor_id: [day_data, ...]}.
+    """
+    doctor_ids = list(doctor_ids)
+    schedules = load_schedules(doctor_ids, start_date, end_date)
+    days_off = load_days_off(doctor_ids, start_date, end_date)
+    booked = load_booked_times(doctor_ids, start_date, end_date)
+
+    availability = {}
+    for doctor_id in doctor_ids:
+        availability[doctor_id] = [
+            build_day_data(
+                current_date,
+                schedules.get((doctor_id, current_date)),
+                days_off.get((doctor_id, current_date)),
+                booked.get((doctor_id, current_date), set())
+            )
+            for current_date in _date_range(start_date, end_date)
+        ]
+    return availability
+
+
+def _free_slots(doctor_id, start_date, end_date, schedules, days_off, booked, from_time, to_time, not_before):
+    """
+    Yields (datetime, doctor_id) for the doctor's free slots in chronological order,
+    building each day's grid only when the previous one is exhausted.
+    """
+    for current_date in _date_range(start_date, end_date):
+        schedule = schedules.get((doctor_id, current_date))
+        if schedule is None or (doctor_id, current_date) in days_off:
+            continue
+        for slot in schedule.get_available_slots(current_date, booked_times=booked.get((doctor_id, current_date), set())):
+            slot_time = slot['datetime'].time()
+            if not slot['is_available'] or slot['datetime'] <= not_before:
+                continue
+            if from_time and slot_time < from_time:
+                continue
+            if to_time and slot_time >= to_time:
+                break
+            yield slot['datetime'], doctor_id
+
+
+def first_free_slots(doctor_ids, start_date, end_date, limit, from_time=None, to_time=None, not_before=None):
+    """
+    Returns the earliest `limit` free slots across several doctors as (datetime, doctor_id) pairs.
+    Loads everything in the same three queries as build_availability, then heap merges the
+    per-doctor slot streams so only the slots up to the limit are generated.
+    """
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids:
+        return []
+    schedules = load_schedules(doctor_ids, start_date, end_date)
+    days_off = load_days_off(doctor_ids, start_date, end_date)
+    booked = load_booked_times(doctor_ids, start_date, end_date)
+    not_before = not_before or datetime.min
+
+    streams = [
+        _free_slots(doctor_id, start_date, end_date, schedules, days_off, booked, from_time, to_time, not_before)
+        for doctor_id in doctor_ids
+    ]
+    return list(islice(heapq.merge(*streams), limit))
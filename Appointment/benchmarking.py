@@ -0,0 +1,211 @@
+"""
+Helpers shared by the benchmark management commands: seeding realistic volumes,
+timing querysets and requests, and comparing JSON reports.
+"""
+import random
+import statistics
+import time as timer
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from Account.models import CustomUser
+from .models import DoctorSchedule, Appointment, DoctorDayOff
+
+SEED_EMAIL_DOMAIN = 'bench.easycare.local'
+SEED_PASSWORD = 'Bench@Passw0rd'
+SPECIALIZATIONS = [
+    'Cardiology', 'Dermatology', 'Neurology', 'Pediatrics', 'Orthopedics',
+    'Ophthalmology', 'Psychiatry', 'Radiology', 'Urology', 'Oncology',
+]
+STATUSES = ['pending', 'confirmed', 'cancelled', 'completed']
+
+
+def _seed_user(number, user_type, password, rng):
+    user = CustomUser(
+        national_id=f'9{number:013d}',
+        email=f'{user_type}{number}@{SEED_EMAIL_DOMAIN}',
+        phone_number=f'9{number:010d}',
+        password=password,
+        full_name=f'Bench {user_type.title()} {number}',
+        gender=rng.choice(['male', 'female']),
+        birthday=date(1960, 1, 1) + timedelta(days=rng.randrange(15000)),
+        address='Benchmark Street',
+        user_type=user_type,
+        account_status='active',
+    )
+    if user_type == 'doctor':
+        user.specialization = rng.choice(SPECIALIZATIONS)
+        user.hospital = f'Hospital {rng.randrange(20)}'
+        user.clinic = f'Clinic {rng.randrange(50)}'
+    return user
+
+
+@transaction.atomic
+def seed(doctors=50, patients=500, appointments=5000, days=60, random_seed=42):
+    """
+    Creates doctors with a weekly schedule (same layout as create_sample_schedules),
+    patients and appointments spread over `days` around today.
+    Uses bulk_create, so no signals run; call clear_seed() to remove everything again.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(SEED_PASSWORD)
+    start_number = CustomUser.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').count()
+
+    doctor_objs = CustomUser.objects.bulk_create([
+        _seed_user(start_number + index, 'doctor', password, rng) for index in range(doctors)
+    ])
+    patient_objs = CustomUser.objects.bulk_create([
+        _seed_user(start_number + doctors + index, 'patient', password, rng) for index in range(patients)
+    ])
+
+    schedules = []
+    for doctor in doctor_objs:
+        for day in range(7):
+            schedules.append(DoctorSchedule(
+                doctor=doctor,
+                day_of_week=day,
+                start_time=time(9, 0),
+                end_time=time(13, 0) if day == 5 else time(17, 0),
+                is_working_day=day != 6,
+                appointment_duration=30,
+            ))
+    DoctorSchedule.objects.bulk_create(schedules)
+
+    today = date.today()
+    first_day = today - timedelta(days=days // 2)
+    DoctorDayOff.objects.bulk_create([
+        DoctorDayOff(doctor=doctor, date=first_day + timedelta(days=rng.randrange(days)), reason='Conference')
+        for doctor in doctor_objs
+    ], ignore_conflicts=True)
+
+    taken = set()
+    rows = []
+    attempts = 0
+    while len(rows) < appointments and attempts < appointments * 10:
+        attempts += 1
+        doctor = rng.choice(doctor_objs)
+        day = first_day + timedelta(days=rng.randrange(days))
+        if day.weekday() == 6:
+            continue
+        slot_time = time(9 + rng.randrange(4 if day.weekday() == 5 else 8), rng.choice([0, 30]))
+        status = rng.choice(STATUSES)
+        if status in Appointment.ACTIVE_STATUSES:
+            if (doctor.id, day, slot_time) in taken:
+                continue
+            taken.add((doctor.id, day, slot_time))
+        rows.append(Appointment(
+            patient=rng.choice(patient_objs),
+            doctor=doctor,
+            appointment_date=day,
+            appointment_time=slot_time,
+            status=status,
+        ))
+    Appointment.objects.bulk_create(rows, batch_size=1000)
+
+    return {'doctors': doctor_objs, 'patients': patient_objs, 'appointments': len(rows)}
+
+
+def clear_seed():
+    """
+    Deletes every user created by seed(), cascading to their schedules and appointments.
+    """
+    return CustomUser.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').delete()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        'runs': len(samples_ms),
+        'p50_ms': round(statistics.median(samples_ms), 3),
+        'p95_ms': round(percentile(samples_ms, 0.95), 3),
+        'p99_ms': round(percentile(samples_ms, 0.99), 3),
+        'max_ms': round(max(samples_ms), 3),
+        # Calls per second of one client calling back to back
+        'throughput_per_s': round(len(samples_ms) * 1000 / sum(samples_ms), 1) if sum(samples_ms) else None,
+    }
+
+
+def time_call(func, runs=20, warmup=2):
+    """
+    Calls func `runs` times after `warmup` untimed calls and returns latency percentiles.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(runs):
+        started = timer.perf_counter()
+        func()
+        samples.append((timer.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def measure(func, runs=20, warmup=2):
+    """
+    Like time_call for a callable returning a response: also reports the number
+    of queries per call and the response status codes.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    queries = []
+    status_codes = Counter()
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as captured:
+            started = timer.perf_counter()
+            response = func()
+            samples.append((timer.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        status_codes[str(response.status_code)] += 1
+    result = summarize(samples)
+    result['queries_p50'] = statistics.median(queries)
+    result['queries_max'] = max(queries)
+    result['status_codes'] = dict(status_codes)
+    return result
+
+
+def compare_reports(baseline, report, threshold=0.2):
+    """
+    Returns (scenario, metric, baseline value, new value) for every scenario whose p95
+    grew by more than `threshold` or that runs more queries than in `baseline`.
+    """
+    regressions = []
+    for name, stats in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        if stats['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append((name, 'p95_ms', old['p95_ms'], stats['p95_ms']))
+        if stats['queries_max'] > old['queries_max']:
+            regressions.append((name, 'queries_max', old['queries_max'], stats['queries_max']))
+    return regressions
+
+
+def legacy_available_slots(schedule, date_obj, booked_times):
+    """
+    The per-slot datetime loop DoctorSchedule.get_available_slots used before slotgrid,
+    kept as the reference for benchmark_slot_grid and its tests.
+    """
+    if not schedule.is_working_day or date_obj.weekday() != schedule.day_of_week:
+        return []
+    if schedule.appointment_duration <= 0:
+        return []
+    slots = []
+    current_datetime = datetime.combine(date_obj, schedule.start_time)
+    end_datetime = datetime.combine(date_obj, schedule.end_time)
+    step = timedelta(minutes=schedule.appointment_duration)
+    while current_datetime < end_datetime:
+        current_time = current_datetime.time()
+        slots.append({
+            'time': current_time.strftime('%H:%M'),
+            'datetime': current_datetime,
+            'is_available': current_time not in booked_times
+        })
+        current_datetime += step
+    return slots
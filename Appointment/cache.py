@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .slots import slot_availability
+
+
+class AvailabilityCache:
+    """
+    Caches the availability day_data dicts per (doctor_id, date).
+
+    Every doctor has a version number that is part of the keys: a schedule change
+    bumps it and so drops all of the doctor's days at once, while bookings and days off
+    only drop the day they touch. The backend is whatever cache alias is configured
+    (local-memory LRU in tests, a shared backend such as Redis with several workers).
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _version_key(self, doctor_id):
+        return f'availability:{doctor_id}:version'
+
+    def _day_key(self, doctor_id, version, day):
+        return f'availability:{doctor_id}:{version}:{day.isoformat()}'
+
+    def _version(self, doctor_id):
+        key = self._version_key(doctor_id)
+        version = self.backend.get(key)
+        if version is None:
+            # Time based so an evicted version never brings back old keys
+            self.backend.add(key, time.time_ns(), timeout=None)
+            version = self.backend.get(key)
+        return version
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_days(self, doctor_id, dates):
+        """
+        Returns {date: day_data} for the dates found in the cache.
+        """
+        version = self._version(doctor_id)
+        keys = {self._day_key(doctor_id, version, day): day for day in dates}
+        found = self.backend.get_many(list(keys))
+        self._count(len(found), len(keys) - len(found))
+        return {keys[key]: day_data for key, day_data in found.items()}
+
+    def set_days(self, doctor_id, days):
+        """
+        Stores {date: day_data} for a doctor.
+        """
+        version = self._version(doctor_id)
+        self.backend.set_many({
+            self._day_key(doctor_id, version, day): day_data
+            for day, day_data in days.items()
+        })
+
+    def invalidate_day(self, doctor_id, day):
+        def invalidate():
+            self.backend.delete(self._day_key(doctor_id, self._version(doctor_id), day))
+
+        invalidate()
+        # Again after commit, so a read racing the transaction can't re-cache stale data
+        transaction.on_commit(invalidate)
+
+    def invalidate_doctor(self, doctor_id):
+        def invalidate():
+            self.backend.set(self._version_key(doctor_id), time.time_ns(), timeout=None)
+
+        invalidate()
+        transaction.on_commit(invalidate)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def clear(self):
+        self.backend.clear()
+        self.reset_stats()
+
+
+availability_cache = AvailabilityCache(getattr(settings, 'AVAILABILITY_CACHE_ALIAS', 'availability'))
+
+
+def cached_availability(doctor_id, start_date, end_date):
+    """
+    Same as slots.slot_availability, served from availability_cache where possible.
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    days = availability_cache.get_days(doctor_id, dates)
+    missing = [day for day in dates if day not in days]
+    if missing:
+        computed = {
+            date.fromisoformat(day_data['date']): day_data
+            for day_data in slot_availability(doctor_id, missing[0], missing[-1])
+        }
+        fresh = {day: computed[day] for day in missing}
+        availability_cache.set_days(doctor_id, fresh)
+        days.update(fresh)
+    return [days[day] for day in dates]
@@ -0,0 +1,168 @@
+"""
+Appointment change events pushed to the affected patient and doctor over Server-Sent Events.
+
+Events go through a broker chosen with the APPOINTMENT_EVENT_BROKER setting. InProcessBroker
+fans events out inside one process only. PostgresBroker carries them between processes (every
+web worker, the outbox worker, management commands) with PostgreSQL LISTEN/NOTIFY.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Events kept for a subscriber that reads slower than they arrive; older ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class BaseBroker:
+    def publish(self, channel, event):
+        """
+        Sends event (a JSON serializable dict) to every subscriber of channel.
+        Called from synchronous code, possibly from any thread.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        """
+        Async context manager yielding an object whose `await get()` returns the next event
+        published on any of channels.
+        """
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # The subscriber's event loop is closed, it is going away
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscribers[channel].discard(subscriber)
+                    if not self._subscribers[channel]:
+                        del self._subscribers[channel]
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Publishes with NOTIFY on the default database; each process with subscribers keeps one
+    LISTEN connection, in a thread, and fans the notifications out to them in process.
+    Events published while that connection is down are lost: streams are a notification
+    channel, clients reload the appointments when they reconnect.
+
+    On other databases (SQLite in development) it delivers in process only.
+    """
+    PG_CHANNEL = 'appointment_events'
+    RECONNECT_DELAY = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, event):
+        if connection.vendor != 'postgresql':
+            return super().publish(channel, event)
+        payload = json.dumps({'channel': channel, 'event': event}, cls=DjangoJSONEncoder)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.PG_CHANNEL, payload])
+
+    def subscribe(self, channels):
+        if connection.vendor == 'postgresql':
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='appointment-events', daemon=True)
+                    self._listener.start()
+        return super().subscribe(channels)
+
+    def _listen(self):
+        import psycopg2
+
+        params = connection.get_connection_params()
+        while True:
+            try:
+                listener = psycopg2.connect(**params)
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.PG_CHANNEL}')
+                while True:
+                    if select.select([listener], [], [], 60) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        message = json.loads(listener.notifies.pop(0).payload)
+                        InProcessBroker.publish(self, message['channel'], message['event'])
+            except psycopg2.Error:
+                logger.exception('Appointment event listener disconnected, reconnecting')
+                time.sleep(self.RECONNECT_DELAY)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'APPOINTMENT_EVENT_BROKER', 'Appointment.events.InProcessBroker'))()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish_appointment_event(appointment, event_type):
+    """
+    Sends an appointment event to its patient and doctor once the transaction commits.
+    """
+    event = {
+        'type': event_type,
+        'appointment': {
+            'id': appointment.id,
+            'status': appointment.status,
+            'appointment_date': str(appointment.appointment_date),
+            'appointment_time': str(appointment.appointment_time),
+            'doctor': appointment.doctor_id,
+            'patient': appointment.patient_id,
+        },
+    }
+
+    def publish():
+        broker = get_broker()
+        for user_id in {appointment.patient_id, appointment.doctor_id}:
+            broker.publish(user_channel(user_id), event)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,69 @@
+"""
+Streaming appointment exports (CSV or NDJSON) shared by the export endpoint and
+the export_appointments command. Rows are read with a server-side cursor where the
+database supports it and written one at a time, so memory use does not grow with the export.
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Appointment
+
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('appointment_date', 'appointment_date'),
+    ('appointment_time', 'appointment_time'),
+    ('status', 'status'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_name', 'doctor__full_name'),
+    ('doctor_specialization', 'doctor__specialization'),
+    ('patient_id', 'patient_id'),
+    ('patient_name', 'patient__full_name'),
+    ('patient_national_id', 'patient__national_id'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+]
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+
+
+def export_rows(doctor_id=None, start_date=None, end_date=None, status=None):
+    """
+    Yields one tuple per appointment, in EXPORT_COLUMNS order, without building model instances.
+    """
+    queryset = Appointment.objects.all()
+    if doctor_id is not None:
+        queryset = queryset.filter(doctor_id=doctor_id)
+    if start_date is not None:
+        queryset = queryset.filter(appointment_date__gte=start_date)
+    if end_date is not None:
+        queryset = queryset.filter(appointment_date__lte=end_date)
+    if status:
+        queryset = queryset.filter(status=status)
+    queryset = queryset.order_by('appointment_date', 'appointment_time', 'id')
+    return queryset.values_list(*[lookup for _, lookup in EXPORT_COLUMNS]).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    # csv.writer needs a file; this one hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(export_format, rows):
+    return iter_csv(rows) if export_format == 'csv' else iter_ndjson(rows)
@@ -0,0 +1,195 @@
+import itertools
+import json
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Account.models import CustomUser
+from Account.serializers import CustomTokenObtainPairSerializer
+from Appointment.models import Appointment, DoctorSlot
+from Appointment.slots import ensure_slots
+from Appointment.benchmarking import (
+    seed, clear_seed, measure, compare_reports, SEED_EMAIL_DOMAIN, SEED_PASSWORD
+)
+
+SCENARIOS = [
+    'availability', 'booking', 'my-appointments', 'doctor-appointments', 'login', 'patient-search', 'registration',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seed realistic volumes and report latency percentiles and query counts of the main API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Seed benchmark data first')
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--appointments', type=int, default=5000)
+        parser.add_argument('--runs', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Only run these scenarios')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='JSON report of a previous run to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='p95 increase, in percent, reported as a regression against --baseline'
+        )
+        parser.add_argument('--clear', action='store_true', help='Delete the seeded benchmark data and exit')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = clear_seed()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} benchmark rows'))
+            return
+
+        if options['seed']:
+            self.stderr.write('Seeding benchmark data...')
+            result = seed(options['doctors'], options['patients'], options['appointments'])
+            self.stderr.write(f"  {len(result['doctors'])} doctors, {len(result['patients'])} patients, "
+                              f"{result['appointments']} appointments")
+
+        seeded = CustomUser.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').order_by('id')
+        self.doctors = list(seeded.filter(user_type='doctor')[:options['runs']])
+        self.patients = list(seeded.filter(user_type='patient')[:options['runs']])
+        if not self.doctors or not self.patients:
+            raise CommandError('No benchmark data found. Run with --seed first.')
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'runs': options['runs'],
+            'volumes': {
+                'doctors': seeded.filter(user_type='doctor').count(),
+                'patients': seeded.filter(user_type='patient').count(),
+                'appointments': Appointment.objects.filter(doctor__in=seeded.filter(user_type='doctor')).count(),
+            },
+            'scenarios': {},
+        }
+        for name in options['scenario'] or SCENARIOS:
+            stats = getattr(self, 'run_' + name.replace('-', '_'))(options['runs'])
+            report['scenarios'][name] = stats
+            self.stderr.write(self.style.SUCCESS(name))
+            self.stderr.write(f"  p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, "
+                              f"{stats['throughput_per_s']}/s, {stats['queries_p50']} queries, "
+                              f"status {stats['status_codes']}")
+
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = compare_reports(baseline, report, options['threshold'] / 100)
+            for name, metric, old, new in regressions:
+                self.stderr.write(self.style.ERROR(f'REGRESSION {name} {metric}: {old} -> {new}'))
+            if not regressions:
+                self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def client_for(self, user):
+        client = APIClient(HTTP_HOST='localhost')
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def rotate(self, users, request):
+        """
+        Returns a callable sending `request(client, user)` as each user in turn.
+        """
+        clients = itertools.cycle([(self.client_for(user), user) for user in users])
+        return lambda: request(*next(clients))
+
+    def run_availability(self, runs):
+        start_date = date.today()
+        params = {'start_date': start_date.isoformat(), 'end_date': (start_date + timedelta(days=6)).isoformat()}
+        doctors = itertools.cycle(self.doctors)
+        return measure(self.rotate(self.patients, lambda client, user: client.get(
+            reverse('doctor-availability', args=[next(doctors).id]), params
+        )), runs=runs)
+
+    def run_booking(self, runs):
+        warmup = 2
+        tomorrow = date.today() + timedelta(days=1)
+        for doctor in self.doctors:
+            ensure_slots(doctor.id, tomorrow, tomorrow + timedelta(days=30))
+        free_slots = iter(
+            DoctorSlot.objects.filter(doctor__in=self.doctors, date__gt=tomorrow, state='free')
+            .order_by('date', 'time', 'doctor_id')[:runs + warmup]
+        )
+
+        def book(client, user):
+            slot = next(free_slots)
+            return client.post(reverse('book-appointment'), {
+                'doctor': slot.doctor_id,
+                'appointment_date': slot.date.isoformat(),
+                'appointment_time': slot.time.strftime('%H:%M'),
+            })
+
+        # The bookings are rolled back so the benchmark can be rerun on the same data
+        try:
+            with transaction.atomic():
+                stats = measure(self.rotate(self.patients, book), runs=runs, warmup=warmup)
+                raise Rollback()
+        except Rollback:
+            pass
+        except StopIteration:
+            raise CommandError(f'Booking needs {runs + warmup} free slots in the next 30 days.')
+        return stats
+
+    def run_my_appointments(self, runs):
+        return measure(self.rotate(self.patients, lambda client, user: client.get(
+            reverse('patient-appointments')
+        )), runs=runs)
+
+    def run_doctor_appointments(self, runs):
+        return measure(self.rotate(self.doctors, lambda client, user: client.get(
+            reverse('doctor-appointments')
+        )), runs=runs)
+
+    def run_login(self, runs):
+        client = APIClient(HTTP_HOST='localhost')
+        users = itertools.cycle(self.patients)
+        return measure(lambda: client.post(reverse('token_obtain_pair'), {
+            'national_id': next(users).national_id, 'password': SEED_PASSWORD
+        }), runs=runs)
+
+    def run_patient_search(self, runs):
+        patients = itertools.cycle(self.patients)
+        return measure(self.rotate(self.doctors, lambda client, user: client.get(
+            reverse('search-patient', args=[next(patients).national_id])
+        )), runs=runs)
+
+    def run_registration(self, runs):
+        warmup = 2
+        client = APIClient(HTTP_HOST='localhost')
+        numbers = itertools.count(CustomUser.objects.count() + 1)
+
+        def register():
+            number = next(numbers)
+            return client.post(reverse('user-register'), {
+                'national_id': f'8{number:013d}',
+                'password': SEED_PASSWORD,
+                'email': f'registration{number}@{SEED_EMAIL_DOMAIN}',
+                'phone_number': f'8{number:010d}',
+                'full_name': f'Bench Registration {number}',
+                'gender': 'female',
+                'birthday': '1990-01-01',
+                'address': 'Benchmark Street',
+                'user_type': 'patient',
+            }, format='json')
+
+        # The registrations are rolled back so the benchmark can be rerun on the same data
+        try:
+            with transaction.atomic():
+                stats = measure(register, runs=runs, warmup=warmup)
+                raise Rollback()
+        except Rollback:
+            pass
+        return stats
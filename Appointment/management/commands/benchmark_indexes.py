@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from Account.models import CustomUser
+from Appointment.models import DoctorSchedule, Appointment, DoctorSlot
+from Appointment.benchmarking import seed, clear_seed, time_call, SEED_EMAIL_DOMAIN
+
+# Indexes added for the hot queries (Appointment 0006, Account 0006)
+HOT_QUERY_INDEXES = [
+    'appt_doctor_date_time_idx',
+    'appt_patient_status_date_idx',
+    'schedule_recurring_idx',
+    'user_type_specialization_idx',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seed realistic volumes and report EXPLAIN plans and latency of the appointment hot queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Seed benchmark data first')
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--appointments', type=int, default=100000)
+        parser.add_argument('--runs', type=int, default=50, help='Timed runs per query')
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Also measure with the hot query indexes dropped inside a rolled back transaction. '
+                 'Takes exclusive locks: never use against a live database.'
+        )
+        parser.add_argument('--clear', action='store_true', help='Delete the seeded benchmark data and exit')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = clear_seed()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} benchmark rows'))
+            return
+
+        if options['seed']:
+            self.stdout.write('Seeding benchmark data...')
+            result = seed(options['doctors'], options['patients'], options['appointments'])
+            self.stdout.write(f"  {len(result['doctors'])} doctors, {len(result['patients'])} patients, "
+                              f"{result['appointments']} appointments")
+
+        queries = self.hot_queries()
+        if not queries:
+            self.stdout.write(self.style.WARNING('No benchmark data found. Run with --seed first.'))
+            return
+
+        if options['compare']:
+            self.stdout.write(self.style.MIGRATE_HEADING('Without hot query indexes'))
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        for index_name in HOT_QUERY_INDEXES:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(index_name)}')
+                    self.report(queries, options['runs'])
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        self.stdout.write(self.style.MIGRATE_HEADING('With hot query indexes'))
+        self.report(queries, options['runs'])
+
+    def hot_queries(self):
+        doctor = CustomUser.objects.filter(user_type='doctor', email__endswith=f'@{SEED_EMAIL_DOMAIN}').first()
+        patient = CustomUser.objects.filter(user_type='patient', email__endswith=f'@{SEED_EMAIL_DOMAIN}').first()
+        if doctor is None or patient is None:
+            return []
+        today = date.today()
+        week_start = DoctorSchedule.week_start_for(today)
+        return [
+            ('booked slots for availability', Appointment.objects.filter(
+                doctor=doctor,
+                appointment_date__gte=today,
+                appointment_date__lte=today + timedelta(days=30),
+                status__in=Appointment.ACTIVE_STATUSES
+            ).values_list('appointment_time')),
+            ('doctor agenda (doctor-appointments?date=)', Appointment.objects.filter(
+                doctor=doctor, appointment_date=today
+            ).order_by('appointment_date', 'appointment_time')),
+            ('patient appointments by status', Appointment.objects.filter(
+                patient=patient, status='confirmed'
+            ).order_by('-appointment_date', '-appointment_time')),
+            ('schedule for date', DoctorSchedule.objects.filter(
+                doctor=doctor, day_of_week=today.weekday()
+            ).filter(Q(week_start_date=week_start) | Q(is_recurring=True))),
+            ('doctors by specialization', CustomUser.objects.filter(
+                user_type='doctor', specialization=doctor.specialization
+            )),
+            ('materialized slots range scan', DoctorSlot.objects.filter(
+                doctor=doctor, date__gte=today, date__lte=today + timedelta(days=30)
+            )),
+        ]
+
+    def report(self, queries, runs):
+        for label, queryset in queries:
+            stats = time_call(lambda: list(queryset.all()), runs=runs)
+            self.stdout.write(self.style.SUCCESS(label))
+            self.stdout.write(f"  p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
@@ -0,0 +1,71 @@
+import random
+from datetime import date, time, timedelta
+from django.core.management.base import BaseCommand
+from Appointment.models import DoctorSchedule
+from Appointment.slotgrid import build_grid, to_slots
+from Appointment.benchmarking import legacy_available_slots, time_call
+
+
+class Command(BaseCommand):
+    help = 'Compare the slot grid generator with the previous per-slot loop on in-memory schedules (no database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--booked', type=float, default=0.3, help='Share of booked slots')
+
+    def handle(self, *args, **options):
+        schedules, booked = self.build_inputs(options['doctors'], options['days'], options['booked'])
+        slot_count = sum(len(offsets) for offsets, _ in build_grid(schedules, booked).values())
+        self.stdout.write(f"{options['doctors']} doctors x {options['days']} days, {slot_count} slots")
+
+        def legacy():
+            return {
+                key: legacy_available_slots(schedule, key[1], booked.get(key, set()))
+                for key, schedule in schedules.items()
+            }
+
+        def grid_only():
+            return build_grid(schedules, booked)
+
+        def grid_to_slots():
+            return {key: to_slots(key[1], offsets, mask) for key, (offsets, mask) in build_grid(schedules, booked).items()}
+
+        results = [
+            ('per-slot loop (previous)', time_call(legacy, runs=options['runs'])),
+            ('slot grid', time_call(grid_only, runs=options['runs'])),
+            ('slot grid + slot dicts', time_call(grid_to_slots, runs=options['runs'])),
+        ]
+        baseline = results[0][1]['p50_ms']
+        for label, stats in results:
+            self.stdout.write(self.style.SUCCESS(label))
+            self.stdout.write(f"  p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+                              f"{baseline / max(stats['p50_ms'], 0.001):.1f}x")
+
+    def build_inputs(self, doctors, days, booked_share):
+        rng = random.Random(42)
+        start_date = date.today()
+        schedules = {}
+        booked = {}
+        for doctor_id in range(1, doctors + 1):
+            duration = rng.choice([15, 20, 30])
+            weekly = {
+                day: DoctorSchedule(
+                    doctor_id=doctor_id, day_of_week=day, start_time=time(9, 0),
+                    end_time=time(13, 0) if day == 5 else time(17, 0), appointment_duration=duration
+                )
+                for day in range(6)
+            }
+            for offset in range(days):
+                current_date = start_date + timedelta(days=offset)
+                schedule = weekly.get(current_date.weekday())
+                if schedule is None:
+                    continue
+                schedules[(doctor_id, current_date)] = schedule
+                booked[(doctor_id, current_date)] = {
+                    slot['datetime'].time()
+                    for slot in legacy_available_slots(schedule, current_date, set())
+                    if rng.random() < booked_share
+                }
+        return schedules, booked
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from Appointment.models import Appointment
+from Appointment.export import export_rows, iter_export, EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments as CSV or NDJSON to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, help='Doctor id')
+        parser.add_argument('--start-date', help='YYYY-MM-DD')
+        parser.add_argument('--end-date', help='YYYY-MM-DD')
+        parser.add_argument('--status', choices=[value for value, _ in Appointment.STATUS_CHOICES])
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write, stdout by default')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ('start_date', 'end_date'):
+            value = options[option]
+            try:
+                dates[option] = parse_date(value) if value else None
+            except ValueError:
+                dates[option] = None
+            if value and dates[option] is None:
+                raise CommandError(f'Invalid {option.replace("_", "-")}: {value}')
+
+        rows = export_rows(options['doctor'], dates['start_date'], dates['end_date'], options['status'])
+        chunks = iter_export(options['export_format'], rows)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
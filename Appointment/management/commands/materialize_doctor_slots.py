@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from Account.models import CustomUser
+from Appointment.slots import ensure_slots, slot_horizon, SLOT_HORIZON_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Materialize doctor slots ahead of time (run on deploy and daily to keep the window rolling)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SLOT_HORIZON_DAYS, help='Number of days ahead to materialize, at most DOCTOR_SLOT_HORIZON_DAYS')
+        parser.add_argument('--doctor', type=int, help='Only materialize this doctor id')
+
+    def handle(self, *args, **options):
+        doctors = CustomUser.objects.filter(user_type='doctor')
+        if options['doctor']:
+            doctors = doctors.filter(id=options['doctor'])
+
+        start_date, last_date = slot_horizon()
+        end_date = min(start_date + timedelta(days=options['days']), last_date)
+        count = 0
+        for doctor_id in doctors.values_list('id', flat=True):
+            ensure_slots(doctor_id, start_date, end_date)
+            count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Materialized slots for {count} doctor(s) until {end_date}')
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Account', '0005_alter_customuser_user_type'),
+        ('Appointment', '0003_alter_appointment_unique_together'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSlotWindow',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='slot_window', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DoctorSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('state', models.CharField(choices=[('free', 'Free'), ('booked', 'Booked'), ('blocked', 'Blocked')], default='free', max_length=10)),
+                ('doctor', models.ForeignKey(limit_choices_to={'user_type': 'doctor'}, on_delete=django.db.models.deletion.CASCADE, related_name='slots', to=settings.AUTH_USER_MODEL)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='Appointment.doctorschedule')),
+            ],
+            options={
+                'ordering': ['date', 'time'],
+                'unique_together': {('doctor', 'date', 'time')},
+            },
+        ),
+    ]
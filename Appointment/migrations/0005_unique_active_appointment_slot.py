@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_double_bookings(apps, schema_editor):
+    """
+    Keep the oldest active appointment of every slot and cancel the others,
+    otherwise the constraint can't be created.
+    """
+    Appointment = apps.get_model('Appointment', 'Appointment')
+    seen = set()
+    active = Appointment.objects.filter(status__in=['confirmed', 'pending']).order_by('created_at', 'id')
+    for appointment in active.iterator():
+        slot = (appointment.doctor_id, appointment.appointment_date, appointment.appointment_time)
+        if slot in seen:
+            appointment.status = 'cancelled'
+            appointment.save(update_fields=['status'])
+        else:
+            seen.add(slot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointment', '0004_doctorslot_doctorslotwindow'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['confirmed', 'pending'])), fields=('doctor', 'appointment_date', 'appointment_time'), name='unique_active_appointment_slot'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointment', '0005_unique_active_appointment_slot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date', 'appointment_time', 'status'], name='appt_doctor_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status', '-appointment_date', '-appointment_time'], name='appt_patient_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorschedule',
+            index=models.Index(condition=models.Q(('is_recurring', True)), fields=['doctor', 'day_of_week'], name='schedule_recurring_idx'),
+        ),
+    ]
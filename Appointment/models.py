@@ -42,11 +42,23 @@ class DoctorSchedule(models.Model):
     class Meta:
         unique_together = ['doctor', 'day_of_week', 'week_start_date']
         ordering = ['week_start_date', 'day_of_week', 'start_time']
+        indexes = [
+            # Week-specific lookups (get_schedule_for_date, availability.load_schedules) use the
+            # (doctor, day_of_week, week_start_date) index behind unique_together
+            models.Index(fields=['doctor', 'day_of_week'], condition=Q(is_recurring=True), name='schedule_recurring_idx'),
+        ]
     
     def __str__(self):
         day_name = dict(self.WEEKDAYS)[self.day_of_week]
         return f"{self.doctor.full_name} - {day_name} ({self.start_time}-{self.end_time}) Week {self.week_start_date}"
 
+    @staticmethod
+    def week_start_for(appointment_date):
+        """
+        Returns the week_start_date a week-specific schedule must carry to apply to appointment_date.
+        """
+        return appointment_date - timedelta(days=appointment_date.weekday() + 1 if appointment_date.weekday() != 6 else 0)
+
     @staticmethod
     def get_schedule_for_date(doctor, appointment_date):
         """
@@ -54,7 +66,7 @@ class DoctorSchedule(models.Model):
         - Prefer week-specific schedule if exists, else recurring.
         """
         day_of_week = appointment_date.weekday()
-        week_start = appointment_date - timedelta(days=appointment_date.weekday() + 1 if appointment_date.weekday() != 6 else 0)
+        week_start = DoctorSchedule.week_start_for(appointment_date)
         schedules = DoctorSchedule.objects.filter(
             doctor=doctor,
             day_of_week=day_of_week
@@ -67,30 +79,25 @@ class DoctorSchedule(models.Model):
             return week_specific
         return schedules.filter(is_recurring=True).first()
     
-    def get_available_slots(self, date_obj):
-        if not self.is_working_day or date_obj.weekday() != self.day_of_week:
+    def get_available_slots(self, date_obj, booked_times=None):
+        """
+        Builds the slot grid for date_obj.
+        booked_times is the set of already booked start times for this doctor and date;
+        when omitted it is loaded with a single query.
+        """
+        from .slotgrid import schedule_offsets, free_mask, to_slots  # Avoid circular import
+        if date_obj.weekday() != self.day_of_week:
+            return []
+        offsets = schedule_offsets(self)
+        if not offsets:
             return []
-        slots = []
-        current_time = self.start_time
-        end_time = self.end_time
-        from .models import Appointment  # Avoid circular import
-        while current_time < end_time:
-            slot_datetime = datetime.combine(date_obj, current_time)
-            is_booked = Appointment.objects.filter(
-                doctor=self.doctor,
+        if booked_times is None:
+            booked_times = set(Appointment.objects.filter(
+                doctor_id=self.doctor_id,
                 appointment_date=date_obj,
-                appointment_time=current_time,
-                status__in=['confirmed', 'pending']
-            ).exists()
-            slots.append({
-                'time': current_time.strftime('%H:%M'),
-                'datetime': slot_datetime,
-                'is_available': not is_booked
-            })
-            current_datetime = datetime.combine(date_obj, current_time)
-            next_datetime = current_datetime + timedelta(minutes=self.appointment_duration)
-            current_time = next_datetime.time()
-        return slots
+                status__in=Appointment.ACTIVE_STATUSES
+            ).values_list('appointment_time', flat=True))
+        return to_slots(date_obj, offsets, free_mask(offsets, self.appointment_duration * 60, booked_times))
 
 
 class Appointment(models.Model):
@@ -103,6 +110,8 @@ class Appointment(models.Model):
         ('cancelled', 'Cancelled'),
         ('completed', 'Completed'),
     ]
+    # Statuses that keep a slot occupied
+    ACTIVE_STATUSES = ['confirmed', 'pending']
     
     patient = models.ForeignKey(
         CustomUser,
@@ -125,8 +134,21 @@ class Appointment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        # unique_together = ['doctor', 'appointment_date', 'appointment_time']
         ordering = ['appointment_date', 'appointment_time']
+        constraints = [
+            # Only one active appointment per slot; cancelled/completed ones don't hold it
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=Q(status__in=['confirmed', 'pending']),
+                name='unique_active_appointment_slot'
+            ),
+        ]
+        indexes = [
+            # DoctorAppointmentsView: doctor [+ date] [+ status], ordered by date and time
+            models.Index(fields=['doctor', 'appointment_date', 'appointment_time', 'status'], name='appt_doctor_date_time_idx'),
+            # PatientAppointmentsView: patient [+ status], newest first
+            models.Index(fields=['patient', 'status', '-appointment_date', '-appointment_time'], name='appt_patient_status_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient.full_name} with Dr. {self.doctor.full_name} on {self.appointment_date} at {self.appointment_time}"
@@ -172,3 +194,54 @@ class DoctorDayOff(models.Model):
     
     def __str__(self):
         return f"Dr. {self.doctor.full_name} - Day off on {self.date}"
+
+
+class DoctorSlot(models.Model):
+    """
+    Precomputed appointment slot of a doctor, maintained from DoctorSchedule,
+    DoctorDayOff and Appointment changes (see Appointment/slots.py)
+    """
+    STATE_CHOICES = [
+        ('free', 'Free'),
+        ('booked', 'Booked'),
+        ('blocked', 'Blocked'),
+    ]
+
+    doctor = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        limit_choices_to={'user_type': 'doctor'},
+        related_name='slots'
+    )
+    schedule = models.ForeignKey(
+        DoctorSchedule,
+        on_delete=models.CASCADE,
+        related_name='slots'
+    )
+    date = models.DateField()
+    time = models.TimeField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='free')
+
+    class Meta:
+        unique_together = ['doctor', 'date', 'time']
+        ordering = ['date', 'time']
+
+    def __str__(self):
+        return f"Dr. {self.doctor.full_name} - {self.date} {self.time.strftime('%H:%M')} ({self.state})"
+
+
+class DoctorSlotWindow(models.Model):
+    """
+    Date range for which a doctor's DoctorSlot rows have been materialized
+    """
+    doctor = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='slot_window'
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    def __str__(self):
+        return f"Dr. {self.doctor.full_name} - slots {self.start_date} to {self.end_date}"
@@ -12,7 +12,34 @@ from .models import Appointment, DoctorSchedule, DoctorDayOff
 from rest_framework.exceptions import PermissionDenied
 from rest_framework import serializers
 from .models import DoctorSchedule
+from .slots import get_day_slots
 from datetime import date, timedelta
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import DoctorSlot
+from django.db.models import Q
+from .slots import rebuild_weekday_slots
+from .cache import availability_cache
+
+
+class SlotConflict(APIException):
+    """
+    Raised when the requested slot was taken, possibly by a concurrent booking
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This time slot is already booked.'
+    default_code = 'slot_conflict'
+
+
+class ScheduleConflict(APIException):
+    """
+    Raised when a concurrent request created one of the schedules of a bulk update
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The schedule was changed by another request, please retry.'
+    default_code = 'schedule_conflict'
+
 
 class DoctorSerializer(serializers.ModelSerializer):
     """
@@ -38,6 +65,16 @@ class DoctorScheduleSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['doctor']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the doctor and loads only the columns this serializer reads
+        """
+        return queryset.select_related('doctor').only(
+            'id', 'doctor', 'day_of_week', 'start_time', 'end_time', 'is_working_day',
+            'appointment_duration', 'week_start_date', 'is_recurring', 'doctor__full_name'
+        )
+
     def get_day_name(self, obj):
         return dict(DoctorSchedule.WEEKDAYS).get(obj.day_of_week, '')
     
@@ -58,6 +95,146 @@ class DoctorScheduleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("End time must be after start time")
         
         return data
+class ScheduleEntrySerializer(serializers.ModelSerializer):
+    """
+    One day of a bulk schedule update
+    """
+    class Meta:
+        model = DoctorSchedule
+        fields = ['day_of_week', 'start_time', 'end_time', 'is_working_day', 'appointment_duration', 'week_start_date']
+        extra_kwargs = {
+            'appointment_duration': {'min_value': 1},
+            'week_start_date': {'required': False},
+        }
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+
+class BulkScheduleSerializer(serializers.Serializer):
+    """
+    Replaces a doctor's weekly template and/or upserts week-specific overrides in one transaction.
+
+    `template` is the full recurring week: recurring days missing from it are deleted.
+    `overrides` are week-specific days; week_start_date may be any day of the week and is
+    stored as the week start used by DoctorSchedule.get_schedule_for_date.
+    save() returns the diff: created, updated (with the changed fields), deleted and unchanged.
+    """
+    DIFF_FIELDS = ['start_time', 'end_time', 'is_working_day', 'appointment_duration']
+    RECURRING_WEEK_START = date(2000, 1, 1)  # Same arbitrary date as DoctorScheduleSerializer
+
+    template = ScheduleEntrySerializer(many=True, required=False)
+    overrides = ScheduleEntrySerializer(many=True, required=False)
+
+    def _duplicates(self, entries, describe):
+        seen = set()
+        errors = []
+        for index, entry in enumerate(entries):
+            key = (entry['week_start_date'], entry['day_of_week'])
+            if key in seen:
+                errors.append(f"Entry {index}: {describe(entry)} is given more than once.")
+            seen.add(key)
+        return errors
+
+    def validate_template(self, entries):
+        for entry in entries:
+            entry['week_start_date'] = self.RECURRING_WEEK_START
+            entry['is_recurring'] = True
+        errors = self._duplicates(entries, lambda entry: dict(DoctorSchedule.WEEKDAYS)[entry['day_of_week']])
+        if errors:
+            raise serializers.ValidationError(errors)
+        return entries
+
+    def validate_overrides(self, entries):
+        errors = []
+        for index, entry in enumerate(entries):
+            if 'week_start_date' not in entry:
+                errors.append(f"Entry {index}: week_start_date is required for overrides.")
+                continue
+            entry['week_start_date'] = DoctorSchedule.week_start_for(entry['week_start_date'])
+            entry['is_recurring'] = False
+        if not errors:
+            errors = self._duplicates(entries, lambda entry: (
+                f"{dict(DoctorSchedule.WEEKDAYS)[entry['day_of_week']]} of the week of {entry['week_start_date']}"
+            ))
+        if errors:
+            raise serializers.ValidationError(errors)
+        return entries
+
+    def validate(self, data):
+        if 'template' not in data and 'overrides' not in data:
+            raise serializers.ValidationError("Provide a template, overrides or both.")
+        return data
+
+    def save(self, doctor):
+        template = self.validated_data.get('template')
+        overrides = self.validated_data.get('overrides', [])
+        override_weeks = {entry['week_start_date'] for entry in overrides}
+
+        scope = Q(week_start_date__in=override_weeks, is_recurring=False)
+        if template is not None:
+            scope |= Q(is_recurring=True)
+
+        try:
+            with transaction.atomic():
+                existing = {}
+                for schedule in DoctorSchedule.objects.select_for_update().filter(doctor=doctor).filter(scope):
+                    schedule.doctor = doctor
+                    existing[(schedule.week_start_date, schedule.day_of_week)] = schedule
+                diff = self._apply(doctor, existing, (template or []) + overrides, delete_recurring=template is not None)
+        except IntegrityError:
+            raise ScheduleConflict()
+        return diff
+
+    def _apply(self, doctor, existing, entries, delete_recurring):
+        created, updated, changes = [], [], []
+        unchanged = 0
+        for entry in entries:
+            schedule = existing.pop((entry['week_start_date'], entry['day_of_week']), None)
+            if schedule is None:
+                created.append(DoctorSchedule(doctor=doctor, **entry))
+                continue
+            before = DoctorScheduleSerializer(schedule).data
+            for field in self.DIFF_FIELDS:
+                setattr(schedule, field, entry[field] if field in entry else DoctorSchedule._meta.get_field(field).default)
+            after = DoctorScheduleSerializer(schedule).data
+            changed = {field: {'old': before[field], 'new': after[field]} for field in self.DIFF_FIELDS if before[field] != after[field]}
+            if changed:
+                updated.append(schedule)
+                changes.append({'schedule': after, 'changes': changed})
+            else:
+                unchanged += 1
+
+        # Whatever is left of the recurring rows is not part of the new template
+        deleted = [schedule for schedule in existing.values() if delete_recurring and schedule.is_recurring]
+        deleted_data = DoctorScheduleSerializer(deleted, many=True).data
+
+        DoctorSchedule.objects.bulk_create(created)
+        DoctorSchedule.objects.bulk_update(updated, self.DIFF_FIELDS)
+        if deleted:
+            # Deleting goes through the post_delete signal, which maintains the slots
+            DoctorSchedule.objects.filter(id__in=[schedule.id for schedule in deleted]).delete()
+
+        # bulk_create/bulk_update send no signals: refresh the slots and cached availability here
+        days_by_week = {}
+        for schedule in created + updated:
+            week = None if schedule.is_recurring else schedule.week_start_date
+            days_by_week.setdefault(week, set()).add(schedule.day_of_week)
+        for week, days in days_by_week.items():
+            rebuild_weekday_slots(doctor.id, days, week)
+        if created or updated or deleted:
+            availability_cache.invalidate_doctor(doctor.id)
+
+        return {
+            'created': DoctorScheduleSerializer(created, many=True).data,
+            'updated': changes,
+            'deleted': deleted_data,
+            'unchanged': unchanged,
+        }
+
+
 # class AppointmentSerializer(serializers.ModelSerializer):
 #     """
 #     Serializer for appointments
@@ -206,6 +383,17 @@ class AppointmentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [ 'created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins patient and doctor and loads only the user columns this serializer reads
+        """
+        return queryset.select_related('patient', 'doctor').only(
+            'id', 'patient', 'doctor', 'appointment_date', 'appointment_time', 'status',
+            'notes', 'doctor_notes', 'created_at', 'updated_at',
+            'patient__full_name', 'doctor__full_name', 'doctor__specialization'
+        )
+
     def get_can_cancel(self, obj):
         return obj.can_be_cancelled()
     
@@ -223,6 +411,39 @@ class AppointmentSerializer(serializers.ModelSerializer):
             pass
 
         return data
+class AgendaAppointmentSerializer(serializers.ModelSerializer):
+    """
+    One appointment of a doctor's daily agenda, with a patient summary.
+    Expects the cancellation cutoff (now + 24 hours) in context['cancel_cutoff'].
+    """
+    patient_name = serializers.CharField(source='patient.full_name', read_only=True)
+    patient_phone = serializers.CharField(source='patient.phone_number', read_only=True)
+    patient_gender = serializers.CharField(source='patient.gender', read_only=True)
+    patient_birthday = serializers.DateField(source='patient.birthday', read_only=True)
+    can_cancel = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Appointment
+        fields = [
+            'id', 'appointment_time', 'status', 'notes', 'doctor_notes',
+            'patient', 'patient_name', 'patient_phone', 'patient_gender', 'patient_birthday',
+            'can_cancel', 'updated_at'
+        ]
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the patient and loads only the columns this serializer reads
+        """
+        return queryset.select_related('patient').only(
+            'id', 'patient', 'appointment_date', 'appointment_time', 'status', 'notes', 'doctor_notes', 'updated_at',
+            'patient__full_name', 'patient__phone_number', 'patient__gender', 'patient__birthday'
+        )
+
+    def get_can_cancel(self, obj):
+        # Same rule as Appointment.can_be_cancelled, without calling timezone.now() per row
+        return obj.status not in ['cancelled', 'completed'] and obj.appointment_datetime > self.context['cancel_cutoff']
+
 class DoctorDayOffSerializer(serializers.ModelSerializer):
     """
     Serializer for doctor's days off
@@ -233,6 +454,15 @@ class DoctorDayOffSerializer(serializers.ModelSerializer):
         model = DoctorDayOff
         fields = ['id', 'doctor', 'doctor_name', 'date', 'reason', 'created_at']
         read_only_fields = ['created_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the doctor and loads only the columns this serializer reads
+        """
+        return queryset.select_related('doctor').only(
+            'id', 'doctor', 'date', 'reason', 'created_at', 'doctor__full_name'
+        )
 class DoctorAvailabilitySerializer(serializers.Serializer):
     """
     Serializer for getting doctor availability for a specific date range
@@ -253,6 +483,55 @@ class DoctorAvailabilitySerializer(serializers.Serializer):
         
         return data
 
+class FirstFreeSlotSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of the first free slot search across doctors
+    """
+    specialization = serializers.CharField()
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    from_time = serializers.TimeField(required=False, input_formats=['%H:%M'])
+    to_time = serializers.TimeField(required=False, input_formats=['%H:%M'])
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=50)
+
+    def validate(self, data):
+        start_date = data.setdefault('start_date', timezone.localdate())
+        end_date = data.setdefault('end_date', start_date + timedelta(days=6))
+
+        if end_date < start_date:
+            raise serializers.ValidationError("End date must be after start date.")
+
+        # Limit to 30 days range
+        if (end_date - start_date).days > 30:
+            raise serializers.ValidationError("Date range cannot exceed 30 days.")
+
+        if data.get('from_time') and data.get('to_time') and data['from_time'] >= data['to_time']:
+            raise serializers.ValidationError("to_time must be after from_time.")
+
+        return data
+
+class AppointmentExportSerializer(serializers.Serializer):
+    """
+    Query parameters of the appointment export
+    """
+    doctor = serializers.IntegerField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Appointment.STATUS_CHOICES, required=False)
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("End date must be after start date.")
+        return data
+
+class DoctorSearchQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the doctor directory search
+    """
+    q = serializers.CharField(min_length=2, max_length=100)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=50)
+
 class BookAppointmentSerializer(serializers.ModelSerializer):
     """
     Simplified serializer for booking appointments
@@ -263,6 +542,8 @@ class BookAppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = ['doctor', 'appointment_date', 'appointment_time', 'notes']
+        # Slot uniqueness is checked in validate() and enforced on insert, answering 409
+        validators = []
         extra_kwargs = {
             'doctor': {'required': True},
             'appointment_date': {'required': True},
@@ -287,34 +568,32 @@ class BookAppointmentSerializer(serializers.ModelSerializer):
             if appointment_datetime <= current_datetime:
                 raise serializers.ValidationError("Appointment must be scheduled for a future date and time.")
             
-            # Get doctor's schedule
-           # Get doctor's schedule (week-specific or recurring)
-            schedule = DoctorSchedule.get_schedule_for_date(doctor, appointment_date)
-            if not schedule or not schedule.is_working_day:
+            # Check the doctor's materialized slots for that day
+            day_slots = get_day_slots(doctor.id, appointment_date)
+            if not day_slots:
                 raise serializers.ValidationError("Doctor is not available on this day.")
-                
+
+            # Check day off
+            if day_slots[0].state == 'blocked':
+                raise serializers.ValidationError("Doctor is not available on this date.")
+
             # Check working hours
-            if not (schedule.start_time <= appointment_time <= schedule.end_time):
+            slot = next((s for s in day_slots if s.time == appointment_time), None)
+            if slot is None:
+                schedule = day_slots[0].schedule
                 raise serializers.ValidationError(
-                    f"Appointment time must be between {schedule.start_time.strftime('%H:%M')} "
+                    f"Appointment time must be one of the doctor's slots between {schedule.start_time.strftime('%H:%M')} "
                     f"and {schedule.end_time.strftime('%H:%M')}."
                 )
-            
-            # Check day off
-            if DoctorDayOff.objects.filter(doctor=doctor, date=appointment_date).exists():
-                raise serializers.ValidationError("Doctor is not available on this date.")
-            
+
             # Check slot availability
-            if Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                status__in=['confirmed', 'pending']
-            ).exists():
-                raise serializers.ValidationError("This time slot is already booked.")
+            if slot.state != 'free':
+                raise SlotConflict()
             
             return data
             
+        except SlotConflict:
+            raise
         except Exception as e:
             print(f"Validation error: {str(e)}")
             raise serializers.ValidationError(str(e))
@@ -334,7 +613,23 @@ class BookAppointmentSerializer(serializers.ModelSerializer):
             validated_data['patient'] = request.user
 
             print("Creating appointment with data:", validated_data)
-            return super().create(validated_data)
+            with transaction.atomic():
+                # Lock the slot row so concurrent bookings of it queue up here
+                slot = DoctorSlot.objects.select_for_update().filter(
+                    doctor=validated_data['doctor'],
+                    date=appointment_date,
+                    time=appointment_time
+                ).first()
+                if slot is None or slot.state != 'free':
+                    raise SlotConflict()
+                try:
+                    with transaction.atomic():
+                        return super().create(validated_data)
+                except IntegrityError:
+                    # unique_active_appointment_slot caught a booking that got in first
+                    raise SlotConflict()
+        except SlotConflict:
+            raise
         except Exception as e:
             import traceback
             print("Error creating appointment:", str(e))
@@ -0,0 +1,106 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from Account.models import CustomUser
+from .models import DoctorSchedule, Appointment, DoctorDayOff
+from .slots import rebuild_slots, rebuild_weekday_slots, refresh_slot_state
+from .cache import availability_cache
+from .events import publish_appointment_event
+
+
+SCHEDULE_SCOPE_FIELDS = {'doctor_id', 'day_of_week', 'is_recurring', 'week_start_date'}
+APPOINTMENT_SLOT_FIELDS = {'doctor_id', 'appointment_date', 'appointment_time'}
+DAY_OFF_FIELDS = {'doctor_id', 'date'}
+
+
+def _is_loaded(instance, fields):
+    # Reading a deferred field here would cost a query per row
+    return instance.pk is not None and not (instance.get_deferred_fields() & fields)
+
+
+def _schedule_scope(schedule):
+    return (schedule.doctor_id, schedule.day_of_week, schedule.is_recurring, schedule.week_start_date)
+
+
+def _appointment_slot(appointment):
+    return (appointment.doctor_id, appointment.appointment_date, appointment.appointment_time)
+
+
+@receiver(post_init, sender=DoctorSchedule)
+def remember_schedule_scope(sender, instance, **kwargs):
+    instance._loaded_scope = _schedule_scope(instance) if _is_loaded(instance, SCHEDULE_SCOPE_FIELDS) else None
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    instance._loaded_slot = _appointment_slot(instance) if _is_loaded(instance, APPOINTMENT_SLOT_FIELDS) else None
+
+
+@receiver(post_init, sender=DoctorDayOff)
+def remember_day_off(sender, instance, **kwargs):
+    instance._loaded_day = (instance.doctor_id, instance.date) if _is_loaded(instance, DAY_OFF_FIELDS) else None
+
+
+def _deleting_doctor(instance, kwargs):
+    # Cascade from this row's deleted doctor: its slots and window go away with it.
+    # A deleted patient's appointments still free their slots.
+    origin = kwargs.get('origin')
+    return isinstance(origin, CustomUser) and origin.pk == instance.doctor_id
+
+
+def _rebuild_schedule_scope(scope):
+    doctor_id, day_of_week, is_recurring, week_start_date = scope
+    rebuild_weekday_slots(doctor_id, {day_of_week}, None if is_recurring else week_start_date)
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    if _deleting_doctor(instance, kwargs):
+        return
+    scopes = {_schedule_scope(instance)}
+    if getattr(instance, '_loaded_scope', None):
+        scopes.add(instance._loaded_scope)
+    for scope in scopes:
+        _rebuild_schedule_scope(scope)
+    availability_cache.invalidate_doctor(instance.doctor_id)
+    instance._loaded_scope = _schedule_scope(instance)
+
+
+@receiver(post_save, sender=DoctorDayOff)
+@receiver(post_delete, sender=DoctorDayOff)
+def day_off_changed(sender, instance, **kwargs):
+    if _deleting_doctor(instance, kwargs):
+        return
+    days = {(instance.doctor_id, instance.date)}
+    if getattr(instance, '_loaded_day', None):
+        # Moved to another date (or doctor): the previous day is no longer blocked
+        days.add(instance._loaded_day)
+    for doctor_id, day in days:
+        rebuild_slots(doctor_id, [day])
+        availability_cache.invalidate_day(doctor_id, day)
+    instance._loaded_day = (instance.doctor_id, instance.date)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    if _deleting_doctor(instance, kwargs):
+        return
+    slots = {_appointment_slot(instance)}
+    if getattr(instance, '_loaded_slot', None):
+        slots.add(instance._loaded_slot)
+    for doctor_id, slot_date, slot_time in slots:
+        refresh_slot_state(doctor_id, slot_date, slot_time)
+        availability_cache.invalidate_day(doctor_id, slot_date)
+    instance._loaded_slot = _appointment_slot(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def broadcast_appointment_change(sender, instance, created, **kwargs):
+    if created:
+        event_type = 'appointment.created'
+    elif instance.status == 'cancelled':
+        event_type = 'appointment.cancelled'
+    else:
+        event_type = 'appointment.updated'
+    publish_appointment_event(instance, event_type)
@@ -0,0 +1,85 @@
+"""
+Slot grids as arrays of second offsets from midnight.
+
+A schedule's grid only depends on its start, end and duration, so it is built once with
+range() and shared by every date and doctor with the same hours. Booked slots are masked by
+computing their index in the grid rather than testing every slot, and the per-slot dicts,
+datetimes and labels are only built at the edge (to_slots) when a response needs them.
+"""
+from array import array
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+# 'HH:MM' label and offset of every minute of the day
+LABELS = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60)]
+MINUTES = [timedelta(minutes=minute) for minute in range(24 * 60)]
+EMPTY = array('l')
+
+
+def to_seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def to_time(seconds):
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+@lru_cache(maxsize=1024)
+def _offsets(start, end, step):
+    return array('l', range(start, end, step))
+
+
+def schedule_offsets(schedule):
+    """
+    Start offsets, in seconds from midnight, of the slots of a DoctorSchedule.
+    The returned array is shared: never modify it.
+    """
+    if not schedule.is_working_day or schedule.appointment_duration <= 0:
+        return EMPTY
+    return _offsets(to_seconds(schedule.start_time), to_seconds(schedule.end_time), schedule.appointment_duration * 60)
+
+
+def free_mask(offsets, step, booked_times):
+    """
+    Returns a bytearray with 1 for every free slot of offsets and 0 for the booked ones.
+    Booked times that don't fall on the grid are ignored.
+    """
+    mask = bytearray(b'\x01') * len(offsets)
+    if offsets:
+        for booked_time in booked_times:
+            index, remainder = divmod(to_seconds(booked_time) - offsets[0], step)
+            if not remainder and 0 <= index < len(offsets):
+                mask[index] = 0
+    return mask
+
+
+def build_grid(schedules, booked):
+    """
+    Builds the grids of many (doctor, date) pairs in one pass.
+    schedules is {(doctor_id, date): DoctorSchedule} and booked {(doctor_id, date): set of times},
+    as returned by availability.load_schedules and load_booked_times.
+    Returns {(doctor_id, date): (offsets, free mask)}; pairs without slots are left out.
+    """
+    grid = {}
+    for key, schedule in schedules.items():
+        if key[1].weekday() != schedule.day_of_week:
+            continue
+        offsets = schedule_offsets(schedule)
+        if offsets:
+            grid[key] = (offsets, free_mask(offsets, schedule.appointment_duration * 60, booked.get(key, ())))
+    return grid
+
+
+def to_slots(day, offsets, mask):
+    """
+    Converts one day of a grid to the slot dicts returned by DoctorSchedule.get_available_slots.
+    """
+    midnight = datetime.combine(day, time())
+    return [
+        {
+            'time': LABELS[offset // 60],
+            'datetime': midnight + (MINUTES[offset // 60] if not offset % 60 else timedelta(seconds=offset)),
+            'is_available': bool(free),
+        }
+        for offset, free in zip(offsets, mask)
+    ]
@@ -0,0 +1,219 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import DoctorSlot, DoctorSlotWindow, Appointment
+from .availability import load_schedules, load_days_off, load_booked_times
+from .slotgrid import build_grid, to_time
+
+# How far ahead slots are materialized; the window never reaches past this nor before today
+SLOT_HORIZON_DAYS = getattr(settings, 'DOCTOR_SLOT_HORIZON_DAYS', 60)
+
+
+def slot_horizon():
+    """
+    First and last date whose slots are materialized.
+    """
+    today = timezone.localdate()
+    return today, today + timedelta(days=SLOT_HORIZON_DAYS)
+
+
+def _build_slots(doctor_id, start_date, end_date, dates=None):
+    """
+    Unsaved DoctorSlot rows for doctor_id between start_date and end_date
+    (restricted to `dates` when given), computed from schedules, days off and bookings.
+    """
+    schedules = load_schedules([doctor_id], start_date, end_date)
+    days_off = load_days_off([doctor_id], start_date, end_date)
+    booked = load_booked_times([doctor_id], start_date, end_date)
+
+    if dates is not None:
+        schedules = {key: schedule for key, schedule in schedules.items() if key[1] in dates}
+
+    rows = []
+    for (_, current_date), (offsets, mask) in build_grid(schedules, booked).items():
+        schedule = schedules[(doctor_id, current_date)]
+        is_day_off = (doctor_id, current_date) in days_off
+        for offset, free in zip(offsets, mask):
+            if is_day_off:
+                state = 'blocked'
+            elif free:
+                state = 'free'
+            else:
+                state = 'booked'
+            rows.append(DoctorSlot(
+                doctor_id=doctor_id,
+                schedule=schedule,
+                date=current_date,
+                time=to_time(offset),
+                state=state
+            ))
+    return rows
+
+
+def _materialize(doctor_id, start_date, end_date, dates=None):
+    DoctorSlot.objects.bulk_create(_build_slots(doctor_id, start_date, end_date, dates), ignore_conflicts=True)
+
+
+def ensure_slots(doctor_id, start_date, end_date):
+    """
+    Makes sure the doctor's slots are materialized for the part of the range within
+    slot_horizon(), growing the materialized window up to the horizon if needed.
+    Dates outside the horizon are never written (see get_day_slots and slot_availability).
+    """
+    first_date, last_date = slot_horizon()
+    start_date, end_date = max(start_date, first_date), min(end_date, last_date)
+    if start_date > end_date:
+        return
+    window = DoctorSlotWindow.objects.filter(doctor_id=doctor_id).first()
+    if window and window.start_date <= start_date and end_date <= window.end_date:
+        return
+
+    end_date = last_date
+    with transaction.atomic():
+        window = DoctorSlotWindow.objects.select_for_update().filter(doctor_id=doctor_id).first()
+        if window is None:
+            _materialize(doctor_id, start_date, end_date)
+            DoctorSlotWindow.objects.bulk_create(
+                [DoctorSlotWindow(doctor_id=doctor_id, start_date=start_date, end_date=end_date)],
+                ignore_conflicts=True
+            )
+            return
+        if start_date < window.start_date:
+            _materialize(doctor_id, start_date, window.start_date - timedelta(days=1))
+            window.start_date = start_date
+        if end_date > window.end_date:
+            _materialize(doctor_id, max(window.end_date + timedelta(days=1), start_date), end_date)
+            window.end_date = end_date
+        window.save()
+
+
+def rebuild_slots(doctor_id, dates):
+    """
+    Regenerates the materialized slots of the given dates, e.g. after a schedule or day off change.
+    Dates outside the materialized window are skipped; they get built when the window grows.
+    """
+    window = DoctorSlotWindow.objects.filter(doctor_id=doctor_id).first()
+    if window is None:
+        return
+    dates = {day for day in dates if window.start_date <= day <= window.end_date}
+    if not dates:
+        return
+    with transaction.atomic():
+        DoctorSlot.objects.filter(doctor_id=doctor_id, date__in=dates).delete()
+        _materialize(doctor_id, min(dates), max(dates), dates=dates)
+
+
+def rebuild_weekday_slots(doctor_id, days_of_week, week_start_date=None):
+    """
+    Regenerates the materialized slots falling on the given weekdays,
+    limited to one week when week_start_date is given.
+    """
+    window = DoctorSlotWindow.objects.filter(doctor_id=doctor_id).first()
+    if window is None:
+        return
+    if week_start_date is not None:
+        start_date = max(window.start_date, week_start_date)
+        end_date = min(window.end_date, week_start_date + timedelta(days=6))
+    else:
+        start_date, end_date = window.start_date, window.end_date
+    dates = []
+    current_date = start_date
+    while current_date <= end_date:
+        if current_date.weekday() in days_of_week:
+            dates.append(current_date)
+        current_date += timedelta(days=1)
+    rebuild_slots(doctor_id, dates)
+
+
+def refresh_slot_state(doctor_id, slot_date, slot_time):
+    """
+    Updates a single slot in place after one of its appointments changed.
+    """
+    is_booked = Appointment.objects.filter(
+        doctor_id=doctor_id,
+        appointment_date=slot_date,
+        appointment_time=slot_time,
+        status__in=Appointment.ACTIVE_STATUSES
+    ).exists()
+    DoctorSlot.objects.filter(
+        doctor_id=doctor_id,
+        date=slot_date,
+        time=slot_time
+    ).exclude(state='blocked').update(state='booked' if is_booked else 'free')
+
+
+def get_day_slots(doctor_id, slot_date):
+    """
+    Returns the materialized slots of one day, with their schedule.
+    """
+    first_date, last_date = slot_horizon()
+    if not first_date <= slot_date <= last_date:
+        # Past or beyond the horizon: computed in memory, nothing is written
+        return _build_slots(doctor_id, slot_date, slot_date)
+    ensure_slots(doctor_id, slot_date, slot_date)
+    return list(
+        DoctorSlot.objects.filter(doctor_id=doctor_id, date=slot_date)
+        .select_related('schedule')
+        .order_by('time')
+    )
+
+
+def slot_availability(doctor_id, start_date, end_date):
+    """
+    Builds the availability day list of a doctor from the materialized slot table.
+    Same shape as availability.build_day_data.
+    """
+    ensure_slots(doctor_id, start_date, end_date)
+    first_date, last_date = slot_horizon()
+    slots_by_date = defaultdict(list)
+    slots = DoctorSlot.objects.filter(
+        doctor_id=doctor_id,
+        date__gte=max(start_date, first_date),
+        date__lte=min(end_date, last_date)
+    ).select_related('schedule').order_by('date', 'time')
+    for slot in slots:
+        slots_by_date[slot.date].append(slot)
+    days = (start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+    outside = {day for day in days if not first_date <= day <= last_date}
+    if outside:
+        # Not materialized (see ensure_slots): computed in memory
+        for slot in _build_slots(doctor_id, start_date, end_date, dates=outside):
+            slots_by_date[slot.date].append(slot)
+    days_off = load_days_off([doctor_id], start_date, end_date)
+
+    availability = []
+    current_date = start_date
+    while current_date <= end_date:
+        day_slots = slots_by_date.get(current_date)
+        day_off = days_off.get((doctor_id, current_date))
+        day_data = {
+            'date': current_date.isoformat(),
+            'day_name': current_date.strftime('%A'),
+            'is_available': False,
+            'slots': [],
+            'reason_unavailable': None
+        }
+        if day_off:
+            day_data['reason_unavailable'] = day_off.reason or 'Day off'
+        elif day_slots:
+            schedule = day_slots[0].schedule
+            day_data['is_available'] = True
+            day_data['slots'] = [
+                {
+                    'time': slot.time.strftime('%H:%M'),
+                    'datetime': datetime.combine(current_date, slot.time),
+                    'is_available': slot.state == 'free'
+                }
+                for slot in day_slots
+            ]
+            day_data['working_hours'] = {
+                'start': schedule.start_time.strftime('%H:%M'),
+                'end': schedule.end_time.strftime('%H:%M')
+            }
+        else:
+            day_data['reason_unavailable'] = 'Not a working day'
+        availability.append(day_data)
+        current_date += timedelta(days=1)
+    return availability
@@ -1,3 +1,840 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Account.models import CustomUser
+from .models import DoctorSchedule, Appointment, DoctorDayOff, DoctorSlot, DoctorSlotWindow
+from .slots import ensure_slots, get_day_slots, slot_horizon
+from .cache import availability_cache
+from .benchmarking import compare_reports, legacy_available_slots
+from .slotgrid import build_grid
+from .events import PostgresBroker, get_broker, user_channel
+from Account.serializers import CustomTokenObtainPairSerializer
+from core.testing import create_user
 
-# Create your tests here.
+
+def next_weekday(weekday, after=None):
+    day = (after or date.today()) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+class DoctorAvailabilityTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor', specialization='Cardiology')
+        self.patient = create_user(2, 'patient')
+        for day in range(6):
+            DoctorSchedule.objects.create(
+                doctor=self.doctor,
+                day_of_week=day,
+                start_time=time(9, 0),
+                end_time=time(12, 0),
+                appointment_duration=30
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.url = reverse('doctor-availability', args=[self.doctor.id])
+
+    def get_availability(self, start_date, end_date):
+        return self.client.get(self.url, {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        })
+
+    def test_query_count_does_not_depend_on_range_length(self):
+        start_date = next_weekday(0)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            appointment_date=start_date, appointment_time=time(9, 30)
+        )
+        DoctorDayOff.objects.create(doctor=self.doctor, date=start_date + timedelta(days=2))
+        ensure_slots(self.doctor.id, start_date, start_date + timedelta(days=30))
+        availability_cache.clear()
+
+        with CaptureQueriesContext(connection) as one_day:
+            response = self.get_availability(start_date, start_date)
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as one_month:
+            response = self.get_availability(start_date, start_date + timedelta(days=30))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['availability']), 31)
+
+        self.assertEqual(len(one_day.captured_queries), len(one_month.captured_queries))
+
+    def test_response_shape(self):
+        monday = next_weekday(0)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            appointment_date=monday, appointment_time=time(9, 30)
+        )
+        DoctorDayOff.objects.create(doctor=self.doctor, date=monday + timedelta(days=1), reason='Conference')
+
+        response = self.get_availability(monday, monday + timedelta(days=6))
+        days = response.data['availability']
+
+        self.assertTrue(days[0]['is_available'])
+        self.assertEqual(days[0]['working_hours'], {'start': '09:00', 'end': '12:00'})
+        self.assertEqual([slot['time'] for slot in days[0]['slots']],
+                         ['09:00', '09:30', '10:00', '10:30', '11:00', '11:30'])
+        self.assertEqual([slot['is_available'] for slot in days[0]['slots']],
+                         [True, False, True, True, True, True])
+        self.assertEqual(days[1]['reason_unavailable'], 'Conference')
+        self.assertEqual(days[6]['reason_unavailable'], 'Not a working day')
+
+    def test_week_specific_schedule_overrides_recurring(self):
+        monday = next_weekday(0)
+        DoctorSchedule.objects.create(
+            doctor=self.doctor,
+            day_of_week=0,
+            start_time=time(14, 0),
+            end_time=time(15, 0),
+            appointment_duration=30,
+            week_start_date=DoctorSchedule.week_start_for(monday),
+            is_recurring=False
+        )
+
+        response = self.get_availability(monday, monday + timedelta(days=7))
+        days = response.data['availability']
+
+        self.assertEqual(days[0]['working_hours'], {'start': '14:00', 'end': '15:00'})
+        self.assertEqual(days[7]['working_hours'], {'start': '09:00', 'end': '12:00'})
+
+
+class DoctorSlotTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor')
+        self.patient = create_user(2, 'patient')
+        self.schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor,
+            day_of_week=0,
+            start_time=time(9, 0),
+            end_time=time(10, 0),
+            appointment_duration=30
+        )
+        self.monday = next_weekday(0)
+        ensure_slots(self.doctor.id, self.monday, self.monday + timedelta(days=7))
+
+    def states(self, day):
+        return dict(DoctorSlot.objects.filter(doctor=self.doctor, date=day).values_list('time', 'state'))
+
+    def test_slots_materialized_from_schedule(self):
+        self.assertEqual(self.states(self.monday), {time(9, 0): 'free', time(9, 30): 'free'})
+        self.assertEqual(self.states(self.monday + timedelta(days=1)), {})
+
+    def test_booking_and_cancelling_update_slot_in_place(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            appointment_date=self.monday, appointment_time=time(9, 30)
+        )
+        self.assertEqual(self.states(self.monday)[time(9, 30)], 'booked')
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.states(self.monday)[time(9, 30)], 'free')
+
+    def test_window_stays_within_the_horizon(self):
+        past = self.monday - timedelta(weeks=52)
+        far = self.monday + timedelta(weeks=52)
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        for start_date in (past, far):
+            response = client.get(reverse('doctor-availability', args=[self.doctor.id]), {
+                'start_date': start_date.isoformat(), 'end_date': (start_date + timedelta(days=6)).isoformat()
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['availability'][0]['slots'][0]['time'], '09:00')
+
+        first_date, last_date = slot_horizon()
+        window = DoctorSlotWindow.objects.get(doctor=self.doctor)
+        self.assertGreaterEqual(window.start_date, first_date)
+        self.assertEqual(window.end_date, last_date)
+        self.assertFalse(DoctorSlot.objects.exclude(date__range=(first_date, last_date)).exists())
+        self.assertEqual([slot.state for slot in get_day_slots(self.doctor.id, far)], ['free', 'free'])
+
+    def test_deleted_patient_frees_the_slot(self):
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            appointment_date=self.monday, appointment_time=time(9, 30)
+        )
+        self.patient.delete()
+        self.assertEqual(self.states(self.monday)[time(9, 30)], 'free')
+
+    def test_day_off_blocks_and_restores_slots(self):
+        day_off = DoctorDayOff.objects.create(doctor=self.doctor, date=self.monday)
+        self.assertEqual(set(self.states(self.monday).values()), {'blocked'})
+
+        day_off.delete()
+        self.assertEqual(set(self.states(self.monday).values()), {'free'})
+
+    def test_moved_day_off_restores_the_previous_date(self):
+        day_off = DoctorDayOff.objects.create(doctor=self.doctor, date=self.monday)
+        next_monday = self.monday + timedelta(days=7)
+        # Loaded again, as an edit through the API would
+        day_off = DoctorDayOff.objects.get(pk=day_off.pk)
+        day_off.date = next_monday
+        day_off.save()
+        self.assertEqual(set(self.states(self.monday).values()), {'free'})
+        self.assertEqual(set(self.states(next_monday).values()), {'blocked'})
+
+    def test_schedule_change_regenerates_slots(self):
+        self.schedule.end_time = time(11, 0)
+        self.schedule.save()
+        self.assertEqual(len(self.states(self.monday)), 4)
+        self.assertEqual(len(self.states(self.monday + timedelta(days=7))), 4)
+
+        self.schedule.day_of_week = 1
+        self.schedule.save()
+        self.assertEqual(self.states(self.monday), {})
+        self.assertEqual(len(self.states(self.monday + timedelta(days=1))), 4)
+
+    def test_booking_rejects_taken_and_off_grid_slots(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        url = reverse('book-appointment')
+        data = {'doctor': self.doctor.id, 'appointment_date': self.monday.isoformat(), 'appointment_time': '09:00'}
+
+        self.assertEqual(client.post(url, data).status_code, 201)
+        self.assertEqual(client.post(url, data).status_code, 409)
+        self.assertEqual(client.post(url, dict(data, appointment_time='09:10')).status_code, 400)
+
+
+class AvailabilityCacheTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor')
+        self.patient = create_user(2, 'patient')
+        self.schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor,
+            day_of_week=0,
+            start_time=time(9, 0),
+            end_time=time(10, 0),
+            appointment_duration=30
+        )
+        self.monday = next_weekday(0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.url = reverse('doctor-availability', args=[self.doctor.id])
+
+    def get_monday(self):
+        response = self.client.get(self.url, {'start_date': self.monday.isoformat()})
+        return response.data['availability'][0]
+
+    def test_repeated_reads_hit_the_cache(self):
+        self.get_monday()
+        self.assertEqual(availability_cache.stats(), {'hits': 0, 'misses': 1})
+        self.get_monday()
+        self.assertEqual(availability_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_booking_and_cancellation_invalidate_the_day(self):
+        self.get_monday()
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            appointment_date=self.monday, appointment_time=time(9, 0)
+        )
+        self.assertFalse(self.get_monday()['slots'][0]['is_available'])
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertTrue(self.get_monday()['slots'][0]['is_available'])
+
+    def test_schedule_and_day_off_changes_invalidate(self):
+        self.get_monday()
+        self.schedule.end_time = time(11, 0)
+        self.schedule.save()
+        self.assertEqual(len(self.get_monday()['slots']), 4)
+
+        DoctorDayOff.objects.create(doctor=self.doctor, date=self.monday, reason='Vacation')
+        self.assertEqual(self.get_monday()['reason_unavailable'], 'Vacation')
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor')
+        self.patients = [create_user(100 + index, 'patient') for index in range(10)]
+        DoctorSchedule.objects.create(
+            doctor=self.doctor,
+            day_of_week=0,
+            start_time=time(9, 0),
+            end_time=time(10, 0),
+            appointment_duration=30
+        )
+        self.monday = next_weekday(0)
+        ensure_slots(self.doctor.id, self.monday, self.monday)
+        self.data = {'doctor': self.doctor.id, 'appointment_date': self.monday.isoformat(), 'appointment_time': '09:00'}
+
+    def book(self, patient):
+        client = APIClient()
+        client.force_authenticate(patient)
+        try:
+            return client.post(reverse('book-appointment'), self.data).status_code
+        finally:
+            connections.close_all()
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_bookings_of_one_slot_have_one_winner(self):
+        with ThreadPoolExecutor(max_workers=len(self.patients)) as executor:
+            codes = list(executor.map(self.book, self.patients))
+
+        self.assertEqual(codes.count(201), 1)
+        self.assertEqual(codes.count(409), len(self.patients) - 1)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, status='pending').count(), 1)
+
+    def test_constraint_rejects_double_booking_with_409(self):
+        Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor,
+            appointment_date=self.monday, appointment_time=time(9, 0)
+        )
+        # Simulate a booking that passed the slot check before the first one landed
+        DoctorSlot.objects.filter(doctor=self.doctor, date=self.monday).update(state='free')
+
+        client = APIClient()
+        client.force_authenticate(self.patients[1])
+        response = client.post(reverse('book-appointment'), self.data)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+
+class AppointmentListQueryCountTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor', specialization='Neurology')
+        self.patient = create_user(2, 'patient')
+        self.client = APIClient()
+        self.monday = next_weekday(0)
+
+    def add_appointments(self, count, offset=0):
+        for index in range(offset, offset + count):
+            other_doctor = create_user(100 + index, 'doctor')
+            Appointment.objects.create(
+                patient=self.patient, doctor=other_doctor,
+                appointment_date=self.monday, appointment_time=time(9, 0)
+            )
+            Appointment.objects.create(
+                patient=create_user(200 + index, 'patient'), doctor=self.doctor,
+                appointment_date=self.monday + timedelta(days=index), appointment_time=time(9, 0)
+            )
+            DoctorSchedule.objects.create(
+                doctor=other_doctor, day_of_week=0, start_time=time(9, 0), end_time=time(10, 0)
+            )
+            DoctorDayOff.objects.create(doctor=self.doctor, date=self.monday + timedelta(days=index))
+
+    def count_queries(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assert_constant_queries(self, user, url):
+        self.add_appointments(1)
+        few = self.count_queries(user, url)
+        self.add_appointments(4, offset=1)
+        many = self.count_queries(user, url)
+        self.assertEqual(few, many)
+
+    def test_patient_appointments(self):
+        self.assert_constant_queries(self.patient, reverse('patient-appointments'))
+
+    def test_doctor_appointments(self):
+        self.assert_constant_queries(self.doctor, reverse('doctor-appointments'))
+
+    def test_doctor_days_off(self):
+        self.assert_constant_queries(self.doctor, reverse('doctor-days-off'))
+
+    def test_doctor_schedule_list(self):
+        self.add_appointments(3)
+        doctor_id = DoctorSchedule.objects.first().doctor_id
+        self.client.force_authenticate(self.patient)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('doctor-schedule', args=[doctor_id]))
+
+    def test_appointment_detail(self):
+        self.add_appointments(1)
+        appointment = Appointment.objects.filter(patient=self.patient).first()
+        self.client.force_authenticate(self.patient)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('appointment-detail', args=[appointment.id]))
+        self.assertEqual(response.data['doctor_name'], appointment.doctor.full_name)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor')
+        self.patient = create_user(2, 'patient')
+        self.monday = next_weekday(0)
+        for day in range(3):
+            for hour in (9, 10, 11):
+                Appointment.objects.create(
+                    patient=self.patient, doctor=self.doctor,
+                    appointment_date=self.monday + timedelta(days=day), appointment_time=time(hour, 0)
+                )
+        self.client = APIClient()
+
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(response.data['results'])
+            if not response.data['next']:
+                return seen
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_row_once_in_order(self):
+        self.client.force_authenticate(self.doctor)
+        rows = self.walk(reverse('doctor-appointments'), {'page_size': 2})
+
+        expected = list(Appointment.objects.order_by('appointment_date', 'appointment_time', 'id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_descending_ordering(self):
+        self.client.force_authenticate(self.patient)
+        rows = self.walk(reverse('patient-appointments'), {'page_size': 4})
+
+        expected = list(Appointment.objects.order_by('-appointment_date', '-appointment_time', '-id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_count_only_when_requested(self):
+        self.client.force_authenticate(self.patient)
+        url = reverse('patient-appointments')
+
+        self.assertNotIn('count', self.client.get(url).data)
+        self.assertEqual(self.client.get(url, {'count': 'true'}).data['count'], 9)
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(reverse('patient-appointments'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class BenchmarkApiCommandTests(TestCase):
+    def test_report_covers_every_scenario(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'benchmark_api', seed=True, doctors=2, patients=3, appointments=10, runs=3,
+                output=path, stdout=StringIO(), stderr=StringIO()
+            )
+            with open(path) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(set(report['scenarios']), {
+            'availability', 'booking', 'my-appointments', 'doctor-appointments', 'login', 'patient-search',
+            'registration',
+        })
+        for name, stats in report['scenarios'].items():
+            self.assertEqual(stats['runs'], 3)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+            self.assertTrue(all(code.startswith('2') for code in stats['status_codes']), name)
+        # Benchmark bookings and registrations are rolled back
+        self.assertEqual(report['volumes']['appointments'], Appointment.objects.count())
+        self.assertEqual(report['scenarios']['registration']['queries_max'], 4)
+        self.assertFalse(CustomUser.objects.filter(full_name__startswith='Bench Registration').exists())
+
+    def test_compare_reports(self):
+        baseline = {'scenarios': {'login': {'p95_ms': 10, 'queries_max': 2}}}
+        report = {'scenarios': {
+            'login': {'p95_ms': 11, 'queries_max': 3},
+            'booking': {'p95_ms': 50, 'queries_max': 9},
+        }}
+        self.assertEqual(compare_reports(baseline, report, threshold=0.2), [('login', 'queries_max', 2, 3)])
+        self.assertEqual(compare_reports(baseline, report, threshold=0.05), [
+            ('login', 'p95_ms', 10, 11), ('login', 'queries_max', 2, 3)
+        ])
+
+
+class FirstAvailableSlotsTests(TestCase):
+    def setUp(self):
+        self.monday = next_weekday(0)
+        self.early = create_user(1, 'doctor', specialization='Cardiology')
+        self.late = create_user(2, 'doctor', specialization='Cardiology')
+        self.other = create_user(3, 'doctor', specialization='Dermatology')
+        self.patient = create_user(4, 'patient')
+        for doctor, start_time in [(self.early, time(9, 0)), (self.late, time(9, 30)), (self.other, time(8, 0))]:
+            DoctorSchedule.objects.create(
+                doctor=doctor, day_of_week=0, start_time=start_time, end_time=time(11, 0), appointment_duration=30
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.url = reverse('first-available-slots')
+
+    def search(self, **params):
+        params = {'specialization': 'cardio', 'start_date': self.monday.isoformat(), 'limit': 4, **params}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['doctor']['id'], row['date'], row['time']) for row in response.data['results']]
+
+    def test_earliest_slots_across_doctors(self):
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.early, appointment_date=self.monday, appointment_time=time(9, 30)
+        )
+        day = self.monday.isoformat()
+        self.assertEqual(self.search(), [
+            (self.early.id, day, '09:00'),
+            (self.late.id, day, '09:30'),
+            (self.early.id, day, '10:00'),
+            (self.late.id, day, '10:00'),
+        ])
+
+    def test_time_window_and_days_off(self):
+        DoctorDayOff.objects.create(doctor=self.early, date=self.monday)
+        end_date = (self.monday + timedelta(days=7)).isoformat()
+        self.assertEqual(self.search(from_time='10:00', to_time='10:30', end_date=end_date, limit=10), [
+            (self.late.id, self.monday.isoformat(), '10:00'),
+            (self.early.id, end_date, '10:00'),
+            (self.late.id, end_date, '10:00'),
+        ])
+
+    def test_query_count_does_not_grow_with_doctors(self):
+        for index in range(10, 30):
+            doctor = create_user(index, 'doctor', specialization='Cardiology')
+            DoctorSchedule.objects.create(
+                doctor=doctor, day_of_week=0, start_time=time(9, 0), end_time=time(17, 0), appointment_duration=30
+            )
+        # Doctors, schedules, days off, bookings
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.search(limit=50)), 50)
+
+    def test_invalid_window(self):
+        response = self.client.get(self.url, {'specialization': 'cardio', 'from_time': '12:00', 'to_time': '09:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DoctorSearchTests(TestCase):
+    def setUp(self):
+        self.cardiologist = create_user(
+            1, 'doctor', specialization='Cardiology', hospital='Nile Hospital', clinic='Heart Clinic'
+        )
+        self.neurologist = create_user(2, 'doctor', specialization='Neurology', hospital='Cairo University Hospital')
+        self.patient = create_user(3, 'patient', specialization='Cardiology')
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def search(self, query):
+        response = self.client.get(reverse('doctor-search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_matches_every_field_and_only_doctors(self):
+        self.assertEqual(self.search('cardiology'), [self.cardiologist.id])
+        self.assertEqual(self.search('heart clinic'), [self.cardiologist.id])
+        self.assertEqual(self.search('cairo university'), [self.neurologist.id])
+        self.assertEqual(sorted(self.search('hospital')), [self.cardiologist.id, self.neurologist.id])
+
+    def test_typo_tolerance_and_ranking(self):
+        self.assertEqual(self.search('cardiolgy'), [self.cardiologist.id])
+        self.assertEqual(self.search('neurolgy'), [self.neurologist.id])
+
+        response = self.client.get(reverse('doctor-search'), {'q': 'nile hospital'})
+        ranks = [row['rank'] for row in response.data['results']]
+        self.assertEqual(response.data['results'][0]['id'], self.cardiologist.id)
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_search_document_follows_profile_changes(self):
+        self.neurologist.specialization = 'Dermatology'
+        self.neurologist.save()
+        self.assertEqual(self.search('dermatology'), [self.neurologist.id])
+        self.assertEqual(self.search('neurology'), [])
+
+
+class DoctorScheduleBulkTests(TestCase):
+    def setUp(self):
+        availability_cache.clear()
+        self.doctor = create_user(1, 'doctor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+        self.url = reverse('doctor-schedule-bulk')
+        self.template = [
+            {'day_of_week': day, 'start_time': '09:00', 'end_time': '12:00'} for day in range(5)
+        ]
+
+    def post(self, data, expected_status=200):
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, expected_status, response.data)
+        return response.data
+
+    def test_template_is_replaced_with_a_diff(self):
+        diff = self.post({'template': self.template})
+        self.assertEqual(len(diff['created']), 5)
+        self.assertEqual(DoctorSchedule.objects.filter(doctor=self.doctor, is_recurring=True).count(), 5)
+
+        monday = next_weekday(0)
+        ensure_slots(self.doctor.id, monday, monday)
+        template = self.template[:4]
+        template[0] = dict(template[0], end_time='10:00')
+        diff = self.post({'template': template})
+
+        self.assertEqual(diff['created'], [])
+        self.assertEqual(diff['unchanged'], 3)
+        self.assertEqual(diff['updated'][0]['changes'], {'end_time': {'old': '12:00:00', 'new': '10:00:00'}})
+        self.assertEqual([row['day_of_week'] for row in diff['deleted']], [4])
+        self.assertEqual(sorted(DoctorSchedule.objects.values_list('day_of_week', flat=True)), [0, 1, 2, 3])
+        # Slots follow the bulk update although bulk_update sends no signals
+        self.assertEqual(DoctorSlot.objects.filter(doctor=self.doctor, date=monday).count(), 2)
+
+    def test_overrides_are_upserted_per_week(self):
+        self.post({'template': self.template})
+        wednesday = next_weekday(2)
+        override = {'day_of_week': 0, 'start_time': '14:00', 'end_time': '16:00', 'week_start_date': wednesday.isoformat()}
+
+        diff = self.post({'overrides': [override]})
+        self.assertEqual(diff['created'][0]['week_start_date'], DoctorSchedule.week_start_for(wednesday).isoformat())
+        self.assertEqual(diff['deleted'], [])
+        self.assertEqual(DoctorSchedule.objects.count(), 6)
+
+        diff = self.post({'overrides': [dict(override, is_working_day=False)]})
+        self.assertEqual(diff['updated'][0]['changes'], {'is_working_day': {'old': True, 'new': False}})
+
+    def test_all_errors_reported_at_once(self):
+        data = self.post({
+            'template': [self.template[0], self.template[0]],
+            'overrides': [{'day_of_week': 1, 'start_time': '12:00', 'end_time': '09:00', 'week_start_date': '2030-01-01'}],
+        }, expected_status=400)
+        self.assertIn('template', data)
+        self.assertIn('overrides', data)
+        self.assertFalse(DoctorSchedule.objects.exists())
+
+    def test_only_doctors(self):
+        self.client.force_authenticate(create_user(2, 'patient'))
+        self.post({'template': self.template}, expected_status=403)
+
+
+class SlotGridTests(TestCase):
+    def test_matches_the_previous_loop(self):
+        monday = next_weekday(0)
+        cases = [
+            (time(9, 0), time(17, 0), 30),
+            (time(9, 0), time(10, 50), 25),
+            (time(8, 15), time(8, 16), 45),
+            (time(23, 0), time(23, 59, 30), 7),
+            (time(9, 0, 30), time(11, 0), 20),
+            (time(12, 0), time(9, 0), 30),
+            (time(9, 0), time(17, 0), 0),
+        ]
+        booked = {time(9, 0), time(9, 30), time(9, 10), time(23, 14), time(9, 20, 30), time(18, 0)}
+        for start_time, end_time, duration in cases:
+            schedule = DoctorSchedule(
+                doctor_id=1, day_of_week=0, start_time=start_time, end_time=end_time, appointment_duration=duration
+            )
+            for day in (monday, monday + timedelta(days=1)):
+                with self.subTest(start=start_time, end=end_time, duration=duration, day=day):
+                    self.assertEqual(
+                        schedule.get_available_slots(day, booked_times=booked),
+                        legacy_available_slots(schedule, day, booked)
+                    )
+
+    def test_build_grid_shares_offsets_and_masks_bookings(self):
+        monday = next_weekday(0)
+        schedule = DoctorSchedule(doctor_id=1, day_of_week=0, start_time=time(9, 0), end_time=time(10, 0))
+        off_day = DoctorSchedule(doctor_id=2, day_of_week=0, start_time=time(9, 0), end_time=time(10, 0), is_working_day=False)
+        next_monday = monday + timedelta(days=7)
+        grid = build_grid(
+            {(1, monday): schedule, (1, next_monday): schedule, (2, monday): off_day},
+            {(1, monday): {time(9, 30)}}
+        )
+        self.assertEqual(set(grid), {(1, monday), (1, next_monday)})
+        self.assertIs(grid[(1, monday)][0], grid[(1, next_monday)][0])
+        self.assertEqual(list(grid[(1, monday)][1]), [1, 0])
+        self.assertEqual(list(grid[(1, next_monday)][1]), [1, 1])
+
+
+class AppointmentExportTests(TestCase):
+    def setUp(self):
+        self.doctor = create_user(1, 'doctor')
+        self.other_doctor = create_user(2, 'doctor')
+        self.patient = create_user(3, 'patient')
+        self.monday = next_weekday(0)
+        for doctor, day, status in [
+            (self.doctor, self.monday, 'confirmed'),
+            (self.doctor, self.monday + timedelta(days=1), 'cancelled'),
+            (self.doctor, self.monday + timedelta(days=40), 'pending'),
+            (self.other_doctor, self.monday, 'pending'),
+        ]:
+            Appointment.objects.create(
+                patient=self.patient, doctor=doctor, appointment_date=day, appointment_time=time(9, 0), status=status
+            )
+        self.client = APIClient()
+        self.url = reverse('appointment-export')
+
+    def export(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_doctor_exports_own_appointments_as_csv(self):
+        lines = self.export(self.doctor, end_date=(self.monday + timedelta(days=30)).isoformat()).splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'appointment_date', 'appointment_time', 'status'])
+        self.assertEqual([line.split(',')[3] for line in lines[1:]], ['confirmed', 'cancelled'])
+
+    def test_staff_ndjson_with_filters(self):
+        staff = create_user(4, 'admin', is_staff=True)
+        rows = [json.loads(line) for line in self.export(staff, output='ndjson', status='pending').splitlines()]
+        self.assertEqual(sorted(row['doctor_id'] for row in rows), sorted([self.doctor.id, self.other_doctor.id]))
+        self.assertEqual(rows[0]['patient_name'], self.patient.full_name)
+
+    def test_permissions(self):
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(self.url, {'doctor': self.other_doctor.id}).status_code, 403)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_appointments', doctor=self.other_doctor.id, export_format='ndjson', stdout=out)
+        self.assertEqual([json.loads(line)['status'] for line in out.getvalue().splitlines()], ['pending'])
+
+
+class DoctorAgendaTests(TestCase):
+    def setUp(self):
+        self.doctor = create_user(1, 'doctor')
+        self.patient = create_user(2, 'patient')
+        self.day = date.today() + timedelta(days=10)
+        self.appointments = [
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_date=self.day, appointment_time=time(hour, 0)
+            )
+            for hour in (11, 9)
+        ]
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=self.day + timedelta(days=1), appointment_time=time(9, 0)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+        self.url = reverse('doctor-agenda')
+
+    def get(self, **headers):
+        return self.client.get(self.url, {'date': self.day.isoformat()}, **headers)
+
+    def test_agenda_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['appointment_time'] for row in response.data['appointments']], ['09:00:00', '11:00:00'])
+        self.assertEqual(response.data['appointments'][0]['patient_name'], self.patient.full_name)
+        self.assertTrue(response.data['appointments'][0]['can_cancel'])
+
+    def test_not_modified_until_the_day_changes(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(1):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        appointment = self.appointments[0]
+        appointment.status = 'confirmed'
+        appointment.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        appointment.delete()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_when_appointments_stop_being_cancellable(self):
+        etag = self.get()['ETag']
+        # The cutoff (now + 24 hours) falls between the two appointments
+        now = timezone.make_aware(datetime.combine(self.day - timedelta(days=1), time(10, 0)))
+        with patch('django.utils.timezone.now', return_value=now):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['can_cancel'] for row in response.data['appointments']], [False, True])
+
+    def test_only_doctors(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.get().status_code, 403)
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event):
+        self.published.append((channel, event['type'], event['appointment']['status']))
+
+
+class AppointmentEventTests(TestCase):
+    def setUp(self):
+        self.doctor = create_user(1, 'doctor')
+        self.patient = create_user(2, 'patient')
+
+    def test_changes_are_published_to_patient_and_doctor_after_commit(self):
+        broker = RecordingBroker()
+        with patch('Appointment.events.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment = Appointment.objects.create(
+                    patient=self.patient, doctor=self.doctor,
+                    appointment_date=next_weekday(0), appointment_time=time(9, 0)
+                )
+                self.assertEqual(broker.published, [])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.status = 'cancelled'
+                appointment.save()
+
+        self.assertEqual(sorted(broker.published), sorted([
+            (user_channel(self.patient.id), 'appointment.created', 'pending'),
+            (user_channel(self.doctor.id), 'appointment.created', 'pending'),
+            (user_channel(self.patient.id), 'appointment.cancelled', 'cancelled'),
+            (user_channel(self.doctor.id), 'appointment.cancelled', 'cancelled'),
+        ]))
+
+    async def test_event_stream(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.patient).access_token
+        response = await self.async_client.get(reverse('appointment-events'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        get_broker().publish(user_channel(self.doctor.id), {'type': 'appointment.created', 'appointment': {'id': 1}})
+        get_broker().publish(user_channel(self.patient.id), {'type': 'appointment.updated', 'appointment': {'id': 2}})
+        chunk = (await anext(stream)).decode()
+        self.assertTrue(chunk.startswith('event: appointment.updated\ndata: '))
+        self.assertEqual(json.loads(chunk.split('data: ')[1])['appointment'], {'id': 2})
+        await stream.aclose()
+
+    async def test_event_stream_requires_a_token_header(self):
+        response = await self.async_client.get(reverse('appointment-events'), headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+        # Query strings end up in access logs
+        token = CustomTokenObtainPairSerializer.get_token(self.patient).access_token
+        response = await self.async_client.get(reverse('appointment-events'), {'token': str(token)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_event_stream_is_refused_under_wsgi(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.patient).access_token
+        response = self.client.get(reverse('appointment-events'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 501)
+
+    def test_postgres_broker_delivers_in_process_without_postgresql(self):
+        broker = PostgresBroker()
+
+        async def receive():
+            async with broker.subscribe([user_channel(self.patient.id)]) as subscription:
+                broker.publish(user_channel(self.patient.id), {'type': 'appointment.updated'})
+                return await asyncio.wait_for(subscription.get(), 1)
+
+        self.assertEqual(async_to_sync(receive)(), {'type': 'appointment.updated'})
+        self.assertIsNone(broker._listener)
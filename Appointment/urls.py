@@ -2,22 +2,33 @@ from django.urls import path
 from .views import (
     AvailableDoctorsView, DoctorScheduleView, doctor_availability,
     BookAppointmentView, PatientAppointmentsView, DoctorAppointmentsView,
-    AppointmentDetailView, DoctorScheduleManageView, DoctorDayOffView
+    AppointmentDetailView, DoctorScheduleManageView, DoctorDayOffView,
+    availability_cache_stats, first_available_slots, doctor_search, DoctorScheduleBulkView,
+    export_appointments, DoctorAgendaView, appointment_events
 )
 
 urlpatterns = [
     # Patient endpoints
     path('doctors/', AvailableDoctorsView.as_view(), name='available-doctors'),
+    path('doctors/search/', doctor_search, name='doctor-search'),
+    path('doctors/first-available/', first_available_slots, name='first-available-slots'),
     path('doctors/<int:doctor_id>/schedule/', DoctorScheduleView.as_view(), name='doctor-schedule'),
     path('doctors/<int:doctor_id>/availability/', doctor_availability, name='doctor-availability'),
     path('book/', BookAppointmentView.as_view(), name='book-appointment'),
+    path('events/', appointment_events, name='appointment-events'),
     path('my-appointments/', PatientAppointmentsView.as_view(), name='patient-appointments'),
+    path('appointments/export/', export_appointments, name='appointment-export'),
     path('appointments/<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
     
     # Doctor endpoints
+    path('doctor/agenda/', DoctorAgendaView.as_view(), name='doctor-agenda'),
     path('doctor/appointments/', DoctorAppointmentsView.as_view(), name='doctor-appointments'),
     path('doctor/schedule/', DoctorScheduleManageView.as_view(), name='doctor-schedule-manage'),
+    path('doctor/schedule/bulk/', DoctorScheduleBulkView.as_view(), name='doctor-schedule-bulk'),
     path('doctor/days-off/', DoctorDayOffView.as_view(), name='doctor-days-off'),
     path('doctor/schedule/<int:pk>/', DoctorScheduleManageView.as_view(), name='doctor-schedule-detail'),
+
+    # Admin endpoints
+    path('availability/cache-stats/', availability_cache_stats, name='availability-cache-stats'),
     
 ]
@@ -1,4 +1,16 @@
-from django.http import Http404
+import asyncio
+import hashlib
+import json
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.db.models import Count, Max
+from rest_framework.views import APIView
 from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -8,10 +20,18 @@ from django.utils import timezone
 from datetime import datetime, date, timedelta
 from django.db.models import Q
 from .models import DoctorSchedule, Appointment, DoctorDayOff
+from .cache import cached_availability, availability_cache
+from .availability import first_free_slots
+from .export import export_rows, iter_export, EXPORT_FORMATS
+from .events import get_broker, user_channel
+from Account.authentication import ClaimsJWTAuthentication
 from Account.models import CustomUser
+from Account.search import search_doctors
 from .serializers import (
     DoctorSerializer, DoctorScheduleSerializer, AppointmentSerializer,
-    DoctorDayOffSerializer, DoctorAvailabilitySerializer, BookAppointmentSerializer
+    DoctorDayOffSerializer, DoctorAvailabilitySerializer, BookAppointmentSerializer,
+    FirstFreeSlotSearchSerializer, DoctorSearchQuerySerializer, BulkScheduleSerializer,
+    AppointmentExportSerializer, AgendaAppointmentSerializer, SlotConflict
 )
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
@@ -26,6 +46,7 @@ class AvailableDoctorsView(generics.ListAPIView):
     """
     serializer_class = DoctorSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('full_name', 'id')
     
     def get_queryset(self):
         specialization = self.request.query_params.get('specialization', None)
@@ -37,16 +58,42 @@ class AvailableDoctorsView(generics.ListAPIView):
         return queryset
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def doctor_search(request):
+    """
+    Ranked, typo tolerant search over doctor names, specializations, hospitals and clinics
+    """
+    serializer = DoctorSearchQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    doctors = search_doctors(
+        CustomUser.objects.filter(user_type='doctor').only(*DoctorSerializer.Meta.fields, 'search_document'),
+        data['q'],
+        limit=data['limit']
+    )
+
+    return Response({
+        'results': [
+            {**DoctorSerializer(doctor).data, 'rank': round(doctor.rank, 3)}
+            for doctor in doctors
+        ]
+    })
+
+
 class DoctorScheduleView(generics.ListAPIView):
     """
     Get doctor's weekly schedule
     """
     serializer_class = DoctorScheduleSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('week_start_date', 'day_of_week', 'id')
     
     def get_queryset(self):
         doctor_id = self.kwargs.get('doctor_id')
-        return DoctorSchedule.objects.filter(doctor_id=doctor_id)
+        return DoctorScheduleSerializer.setup_eager_loading(DoctorSchedule.objects.filter(doctor_id=doctor_id))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -64,49 +111,57 @@ def doctor_availability(request, doctor_id):
     
     doctor = get_object_or_404(CustomUser, id=doctor_id, user_type='doctor')
     
-    availability = []
-    current_date = start_date
-    
-    while current_date <= end_date:
-        day_of_week = current_date.weekday()
-        
-        # Get doctor's schedule for this day
-        schedule = DoctorSchedule.get_schedule_for_date(doctor, current_date)
-        
-        # Check if doctor has a day off
-        day_off = DoctorDayOff.objects.filter(
-            doctor=doctor,
-            date=current_date
-        ).first()
-        
-        day_data = {
-            'date': current_date.isoformat(),
-            'day_name': current_date.strftime('%A'),
-            'is_available': False,
-            'slots': [],
-            'reason_unavailable': None
-        }
-        
-        if day_off:
-            day_data['reason_unavailable'] = day_off.reason or 'Day off'
-        elif schedule and schedule.is_working_day:
-            day_data['is_available'] = True
-            day_data['slots'] = schedule.get_available_slots(current_date)
-            day_data['working_hours'] = {
-                'start': schedule.start_time.strftime('%H:%M'),
-                'end': schedule.end_time.strftime('%H:%M')
-            }
-        else:
-            day_data['reason_unavailable'] = 'Not a working day'
-        
-        availability.append(day_data)
-        current_date += timedelta(days=1)
+    availability = cached_availability(doctor.id, start_date, end_date)
     
     return Response({
         'doctor': DoctorSerializer(doctor).data,
         'availability': availability
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def first_available_slots(request):
+    """
+    Earliest free slots across all doctors of a specialization,
+    optionally restricted to a time of day window
+    """
+    serializer = FirstFreeSlotSearchSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    doctors = {
+        doctor.id: doctor
+        for doctor in CustomUser.objects.filter(
+            user_type='doctor', specialization__icontains=data['specialization']
+        ).only(*DoctorSerializer.Meta.fields)
+    }
+    slots = first_free_slots(
+        doctors, data['start_date'], data['end_date'], data['limit'],
+        from_time=data.get('from_time'),
+        to_time=data.get('to_time'),
+        not_before=timezone.localtime().replace(tzinfo=None)
+    )
+
+    return Response({
+        'results': [
+            {
+                'doctor': DoctorSerializer(doctors[doctor_id]).data,
+                'date': slot_datetime.date().isoformat(),
+                'time': slot_datetime.strftime('%H:%M'),
+            }
+            for slot_datetime, doctor_id in slots
+        ]
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, permissions.IsAdminUser])
+def availability_cache_stats(request):
+    """
+    Hit/miss counters of the availability cache in this worker
+    """
+    return Response(availability_cache.stats())
+
 class BookAppointmentView(generics.CreateAPIView):
     serializer_class = BookAppointmentSerializer
     permission_classes = [IsAuthenticated]
@@ -122,19 +177,14 @@ class BookAppointmentView(generics.CreateAPIView):
                 return Response({"error": "Doctor and appointment_date are required."}, status=400)
 
             doctor = get_object_or_404(CustomUser, id=doctor_id, user_type='doctor')
-            date_obj = datetime.strptime(appointment_date, "%Y-%m-%d").date()
-
-            # Use the robust schedule lookup
-            schedule = DoctorSchedule.get_schedule_for_date(doctor, date_obj)
-            if not schedule or not schedule.is_working_day:
-                return Response({"error": "No working schedule for this doctor on this date."}, status=400)
-
-            # Optionally: check if the requested time is within the schedule's available slots
 
+            # Schedule, day off and slot checks happen in BookAppointmentSerializer against the slot table
             response = super().create(request, *args, **kwargs)
             print("Appointment created successfully")
             return response
 
+        except SlotConflict as e:
+            return Response({"error": str(e.detail)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             print(f"Error in BookAppointmentView: {str(e)}")
             return Response(
@@ -149,6 +199,7 @@ class PatientAppointmentsView(generics.ListAPIView):
     """
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-appointment_date', '-appointment_time', '-id')
     
     def get_queryset(self):
         user = self.request.user
@@ -156,7 +207,7 @@ class PatientAppointmentsView(generics.ListAPIView):
             return Appointment.objects.none()
         
         status_filter = self.request.query_params.get('status', None)
-        queryset = Appointment.objects.filter(patient=user)
+        queryset = AppointmentSerializer.setup_eager_loading(Appointment.objects.filter(patient=user))
         
         if status_filter:
             queryset = queryset.filter(status=status_filter)
@@ -170,6 +221,7 @@ class DoctorAppointmentsView(generics.ListAPIView):
     """
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('appointment_date', 'appointment_time', 'id')
     
     def get_queryset(self):
         user = self.request.user
@@ -179,7 +231,7 @@ class DoctorAppointmentsView(generics.ListAPIView):
         status_filter = self.request.query_params.get('status', None)
         date_filter = self.request.query_params.get('date', None)
         
-        queryset = Appointment.objects.filter(doctor=user)
+        queryset = AppointmentSerializer.setup_eager_loading(Appointment.objects.filter(doctor=user))
         
         if status_filter:
             queryset = queryset.filter(status=status_filter)
@@ -194,6 +246,87 @@ class DoctorAppointmentsView(generics.ListAPIView):
         return queryset.order_by('appointment_date', 'appointment_time')
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_appointments(request):
+    """
+    Streams appointments as CSV or NDJSON, filtered by doctor, date range and status.
+    Doctors export their own appointments, staff any doctor's.
+    """
+    serializer = AppointmentExportSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    doctor_id = data.get('doctor')
+    if request.user.user_type == 'doctor' and not request.user.is_staff:
+        if doctor_id not in (None, request.user.id):
+            return Response({'detail': 'You can only export your own appointments.'}, status=status.HTTP_403_FORBIDDEN)
+        doctor_id = request.user.id
+    elif not request.user.is_staff:
+        return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+    rows = export_rows(doctor_id, data.get('start_date'), data.get('end_date'), data.get('status'))
+    response = StreamingHttpResponse(iter_export(data['output'], rows), content_type=EXPORT_FORMATS[data['output']])
+    response['Content-Disposition'] = f'attachment; filename="appointments.{data["output"]}"'
+    return response
+
+
+class DoctorAgendaView(APIView):
+    """
+    The current doctor's appointments of one day (?date=YYYY-MM-DD, today by default).
+    Responses carry an ETag built from one aggregate query, so a poll with a matching
+    If-None-Match gets a 304 without loading or serializing any appointment.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.user_type != 'doctor':
+            return Response({'detail': 'Only doctors have an agenda.'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            day = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date()
+        except KeyError:
+            day = timezone.localdate()
+        except ValueError:
+            return Response({'date': ['Use the YYYY-MM-DD format.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Appointment.objects.filter(doctor=request.user, appointment_date=day)
+        cancel_cutoff = timezone.now() + timedelta(hours=24)
+        etag = self.get_etag(request.user.id, day, queryset, cancel_cutoff)
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        appointments = AgendaAppointmentSerializer.setup_eager_loading(queryset).order_by('appointment_time', 'id')
+        serializer = AgendaAppointmentSerializer(appointments, many=True, context={'cancel_cutoff': cancel_cutoff})
+        response = Response({'date': day.isoformat(), 'appointments': serializer.data})
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @staticmethod
+    def get_etag(doctor_id, day, queryset, cancel_cutoff):
+        """
+        Changes whenever an appointment of the day is added, removed or saved, and when
+        one stops being cancellable because the 24 hour cutoff moved past it.
+        """
+        cutoff = timezone.localtime(cancel_cutoff)
+        cancellable = (
+            ~Q(status__in=['cancelled', 'completed']) &
+            (Q(appointment_date__gt=cutoff.date()) |
+             Q(appointment_date=cutoff.date(), appointment_time__gt=cutoff.time()))
+        )
+        summary = queryset.aggregate(
+            count=Count('id'),
+            last_update=Max('updated_at'),
+            cancellable=Count('id', filter=cancellable),
+        )
+        key = f"{doctor_id}:{day}:{summary['count']}:{summary['last_update']}:{summary['cancellable']}"
+        return quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Get, update, or cancel a specific appointment
@@ -204,9 +337,9 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.user_type == 'patient':
-            return Appointment.objects.filter(patient=user)
+            return AppointmentSerializer.setup_eager_loading(Appointment.objects.filter(patient=user))
         elif user.user_type == 'doctor':
-            return Appointment.objects.filter(doctor=user)
+            return AppointmentSerializer.setup_eager_loading(Appointment.objects.filter(doctor=user))
         return Appointment.objects.none()
     
     # def update(self, request, *args, **kwargs):
@@ -270,15 +403,16 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
 class DoctorScheduleManageView(generics.ListCreateAPIView, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DoctorScheduleSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('week_start_date', 'day_of_week', 'id')
     
     def get_queryset(self):
         # Get both recurring and current week's schedules for the logged-in doctor
         today = date.today()
         current_week = today - timedelta(days=today.weekday())
-        return DoctorSchedule.objects.filter(
+        return DoctorScheduleSerializer.setup_eager_loading(DoctorSchedule.objects.filter(
             Q(doctor=self.request.user) &
             (Q(is_recurring=True) | Q(week_start_date=current_week))
-        ).order_by('week_start_date', 'day_of_week')
+        )).order_by('week_start_date', 'day_of_week')
     
     def get_object(self):
         # Custom object lookup to ensure we only get the doctor's own schedules
@@ -291,18 +425,82 @@ class DoctorScheduleManageView(generics.ListCreateAPIView, generics.RetrieveUpda
     def perform_create(self, serializer):
         serializer.save(doctor=self.request.user)
 
+class DoctorScheduleBulkView(generics.GenericAPIView):
+    """
+    Sets a doctor's weekly template and/or week-specific overrides in one request,
+    returning what was created, updated and deleted
+    """
+    serializer_class = BulkScheduleSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.user.user_type != 'doctor':
+            return Response({'detail': 'Only doctors can manage schedules.'}, status=status.HTTP_403_FORBIDDEN)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(doctor=request.user))
+
 class DoctorDayOffView(generics.ListCreateAPIView):
     """
     Manage doctor's days off (for doctors only)
     """
     serializer_class = DoctorDayOffSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('date', 'id')
     
     def get_queryset(self):
         user = self.request.user
         if user.user_type != 'doctor':
             return DoctorDayOff.objects.none()
-        return DoctorDayOff.objects.filter(doctor=user)
+        return DoctorDayOffSerializer.setup_eager_loading(DoctorDayOff.objects.filter(doctor=user))
     
     def perform_create(self, serializer):
         serializer.save(doctor=self.request.user)
+
+
+# Comment line sent when no event arrived for this many seconds, so proxies keep the stream open
+EVENT_STREAM_HEARTBEAT = 15
+
+
+def authenticate_event_stream(request):
+    """
+    Returns the user of the request's JWT (Authorization header), None if missing or invalid.
+    Tokens are not accepted in the query string, which ends up in access logs: browsers use
+    a fetch based EventSource that can send the header.
+    """
+    try:
+        result = ClaimsJWTAuthentication().authenticate(request)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return result[0] if result is not None else None
+
+
+async def appointment_events(request):
+    """
+    Server-Sent Events stream of the current user's appointment changes
+    (appointment.created, appointment.updated, appointment.cancelled).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI Django consumes the whole (endless) stream before sending anything,
+        # holding a worker forever
+        return JsonResponse({'detail': 'The event stream needs the ASGI server.'}, status=501)
+    user = await sync_to_async(authenticate_event_stream)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    async def stream():
+        async with get_broker().subscribe([user_channel(user.id)]) as subscription:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), EVENT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -2,7 +2,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.mail import send_mail
+from Outbox.utils import enqueue_mail
 from .serializers import ContactUsSerializer
 from django.conf import settings
 
@@ -30,12 +30,11 @@ class ContactUsView(APIView):
 
             recipient_email = settings.EMAIL_HOST_USER
 
-            send_mail(
+            enqueue_mail(
                 subject,
                 message_body,
                 settings.DEFAULT_FROM_EMAIL,
-                [recipient_email],
-                fail_silently=False
+                [recipient_email]
             )
 
             return Response({"message": "Your message has been received and emailed."}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import OutboxEmail
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'recipients']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from Outbox.utils import send_due_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches (use --loop to keep running as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new emails')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_due_emails(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} email(s), {failed} failed')
+            if not options['loop']:
+                break
+            # Drain the queue batch after batch, sleep only once it is empty
+            if not (sent or failed):
+                time.sleep(options['interval'])
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from io import StringIO
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core.testing import create_user
+from .models import OutboxEmail
+from .utils import enqueue_mail, send_due_emails, OUTBOX_MAX_ATTEMPTS
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP unavailable')
+
+
+class CountingBackend(BaseEmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, email_messages):
+        return len(email_messages)
+
+
+class CrashingBackend(BaseEmailBackend):
+    delivered = []
+
+    def send_messages(self, email_messages):
+        if CrashingBackend.delivered:
+            # The worker process dies in the middle of the batch
+            raise KeyboardInterrupt
+        CrashingBackend.delivered.extend(message.subject for message in email_messages)
+        return len(email_messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def test_worker_sends_queued_emails(self):
+        enqueue_mail('Hello', 'Body', 'from@example.com', ['to@example.com'])
+        enqueue_mail('Hello again', 'Body', 'from@example.com', ['to@example.com'])
+
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual([message.subject for message in mail.outbox], ['Hello', 'Hello again'])
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    @override_settings(EMAIL_BACKEND='Outbox.tests.CountingBackend')
+    def test_one_connection_per_batch(self):
+        CountingBackend.opened = 0
+        for index in range(5):
+            enqueue_mail(f'Email {index}', 'Body', 'from@example.com', ['to@example.com'])
+
+        self.assertEqual(send_due_emails(batch_size=10), (5, 0))
+        self.assertEqual(CountingBackend.opened, 1)
+
+    @override_settings(EMAIL_BACKEND='Outbox.tests.FailingBackend')
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        email = enqueue_mail('Hello', 'Body', 'from@example.com', ['to@example.com'])
+
+        self.assertEqual(send_due_emails(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('SMTP unavailable', email.last_error)
+
+        # Not due yet
+        self.assertEqual(send_due_emails(), (0, 0))
+
+        for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+            send_due_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', OUTBOX_MAX_ATTEMPTS))
+
+    @override_settings(EMAIL_BACKEND='Outbox.tests.CrashingBackend')
+    def test_crash_only_resends_the_email_in_flight(self):
+        CrashingBackend.delivered = []
+        first = enqueue_mail('First', 'Body', 'from@example.com', ['to@example.com'])
+        second = enqueue_mail('Second', 'Body', 'from@example.com', ['to@example.com'])
+
+        with self.assertRaises(KeyboardInterrupt):
+            send_due_emails()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('sent', 'sending'))
+        # Claimed: not picked up again until the claim runs out
+        self.assertEqual(send_due_emails(), (0, 0))
+
+        OutboxEmail.objects.filter(pk=second.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        CrashingBackend.delivered = []
+        self.assertEqual(send_due_emails(), (1, 0))
+        self.assertEqual(CrashingBackend.delivered, ['Second'])
+
+    def test_password_reset_only_enqueues(self):
+        patient = create_user(1, 'patient')
+
+        response = APIClient().post(reverse('request_password_reset'), {'email': patient.email})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().recipients, [patient.email])
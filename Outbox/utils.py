@@ -0,0 +1,104 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+# Retry delays grow as base * 2 ** (attempts - 1), capped
+OUTBOX_RETRY_BASE_SECONDS = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 30)
+OUTBOX_RETRY_MAX_SECONDS = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600)
+# How long a claimed email is left to its worker before another one may send it; must cover
+# a whole batch (batch size x SMTP timeout)
+OUTBOX_CLAIM_SECONDS = getattr(settings, 'OUTBOX_CLAIM_SECONDS', 600)
+
+
+def enqueue_mail(subject, message, from_email, recipient_list):
+    """
+    Drop-in replacement for send_mail in request handlers: stores the email
+    for the send_outbox worker instead of talking to SMTP.
+    """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        recipients=list(recipient_list)
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS))
+
+
+def claim_due_emails(batch_size=50):
+    """
+    Marks up to batch_size due emails as sending, for OUTBOX_CLAIM_SECONDS, and returns them.
+    Committed before anything is sent, so no lock or transaction is held during SMTP I/O.
+    A claim that runs out (the worker died) makes the email due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=OutboxEmail.QUEUED_STATUSES, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status='sending', next_attempt_at=now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+        )
+    return emails
+
+
+def send_due_emails(batch_size=50):
+    """
+    Sends up to batch_size due emails over a single mail connection.
+    Each result is saved as soon as it is known, so a crash only sends again the email
+    that was in flight. Returns (sent, failed) counts.
+    """
+    sent = failed = 0
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return sent, failed
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Nothing can go out: count it as an attempt for the whole batch
+        for email in emails:
+            _record_failure(email, e)
+        return sent, len(emails)
+
+    try:
+        for email in emails:
+            message = EmailMessage(
+                email.subject, email.message, email.from_email, email.recipients,
+                connection=connection
+            )
+            try:
+                message.send()
+            except Exception as e:
+                _record_failure(email, e)
+                failed += 1
+            else:
+                email.status = 'sent'
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
@@ -9,5 +9,12 @@ class Prescription(models.Model):
     instructions = models.TextField()
     created_at = models.DateField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Prescription history and the recent slice in PatientSerializer: patient, newest first
+            models.Index(fields=['patient', '-created_at', '-id'], name='prescription_patient_date_idx'),
+        ]
+
     def __str__(self):
         return f"Prescription for {self.patient.full_name} by {self.doctor.full_name}"
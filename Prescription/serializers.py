@@ -9,3 +9,24 @@ class PrescriptionSerializer(serializers.ModelSerializer):
         fields = ['medicine_name', 'dosage', 'instructions', 'created_at', 'doctor', 'patient']
         read_only_fields = ['doctor', 'patient', 'created_at']
 
+
+class PrescriptionHistorySerializer(serializers.ModelSerializer):
+    doctor = serializers.CharField(source='doctor.full_name', read_only=True)
+
+    class Meta:
+        model = Prescription
+        fields = ['id', 'medicine_name', 'dosage', 'instructions', 'created_at', 'doctor_id', 'doctor']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('doctor').only(
+            'patient', 'doctor', 'medicine_name', 'dosage', 'instructions', 'created_at', 'doctor__full_name'
+        )
+
+
+class PrescriptionHistoryFilterSerializer(serializers.Serializer):
+    """
+    Query parameters of a patient's prescription history
+    """
+    doctor = serializers.IntegerField(required=False)
+    medicine = serializers.CharField(required=False, max_length=255)
@@ -1,3 +1,66 @@
+from datetime import date, timedelta
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from Account.serializers import PatientSerializer
+from core.testing import create_user
+from .models import Prescription
 
-# Create your tests here.
+
+class PrescriptionHistoryTests(TestCase):
+    def setUp(self):
+        self.doctors = [create_user(index, 'doctor') for index in (1, 2)]
+        self.patient = create_user(10, 'patient')
+        self.other_patient = create_user(11, 'patient')
+        today = date.today()
+        for number in range(25):
+            prescription = Prescription.objects.create(
+                patient=self.patient, doctor=self.doctors[number % 2],
+                medicine_name='Insulin' if number % 5 == 0 else f'Medicine {number}', dosage='1', instructions='-'
+            )
+            # auto_now_add ignores the value given to create()
+            Prescription.objects.filter(pk=prescription.pk).update(created_at=today - timedelta(days=number // 3))
+        self.client = APIClient()
+        self.client.force_authenticate(create_user(3, 'pharmacist'))
+        self.url = reverse('prescription_history', args=[self.patient.national_id])
+
+    def test_pages_are_newest_first_without_gaps(self):
+        expected = list(Prescription.objects.filter(patient=self.patient).values_list('id', flat=True))
+        seen = []
+        url = self.url + '?page_size=7'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        dates = [row.created_at for row in Prescription.objects.filter(pk__in=seen)]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_filters(self):
+        response = self.client.get(self.url, {'doctor': self.doctors[1].id})
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertEqual({row['doctor'] for row in response.data['results']}, {'User 002'})
+
+        response = self.client.get(self.url, {'medicine': 'insul'})
+        self.assertEqual(len(response.data['results']), 5)
+
+        response = self.client.get(self.url, {'doctor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_permissions(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.client.force_authenticate(self.other_patient)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        response = self.client.get(reverse('prescription_history', args=['99999999999999']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_patient_serializer_embeds_recent_slice(self):
+        data = PatientSerializer(self.patient).data
+        latest = Prescription.objects.filter(patient=self.patient)[:PatientSerializer.RECENT_PRESCRIPTIONS]
+        self.assertEqual(len(data['prescriptions']), PatientSerializer.RECENT_PRESCRIPTIONS)
+        self.assertEqual([row['medicine_name'] for row in data['prescriptions']], [row.medicine_name for row in latest])
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import AddPrescriptionView
+from .views import AddPrescriptionView, PrescriptionHistoryView
 
 urlpatterns = [
     path('patients/<str:patient_national_id>/prescriptions/', AddPrescriptionView.as_view(), name='add_prescription'),
+    path('patients/<str:patient_national_id>/prescriptions/history/', PrescriptionHistoryView.as_view(), name='prescription_history'),
 ]
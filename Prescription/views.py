@@ -1,8 +1,10 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from .models import CustomUser
-from .serializers import PrescriptionSerializer
+from rest_framework import status, generics
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAuthenticated
+from .models import CustomUser, Prescription
+from .serializers import PrescriptionSerializer, PrescriptionHistorySerializer, PrescriptionHistoryFilterSerializer
 from django.shortcuts import get_object_or_404
 
 class AddPrescriptionView(APIView):
@@ -21,3 +23,34 @@ class AddPrescriptionView(APIView):
             }
             return Response(response_data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class PrescriptionHistoryView(generics.ListAPIView):
+    """
+    A patient's prescriptions, newest first, for doctors, pharmacists and the patient.
+    Filters: ?doctor=<id> and ?medicine=<part of the medicine name>.
+    """
+    serializer_class = PrescriptionHistorySerializer
+    permission_classes = [IsAuthenticated]
+    # Backed by prescription_patient_date_idx
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.user_type not in ['doctor', 'pharmacist', 'patient']:
+            raise PermissionDenied('You do not have permission to perform this action.')
+
+        filters = PrescriptionHistoryFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        patient = get_object_or_404(
+            CustomUser.objects.only('id'), national_id=self.kwargs['patient_national_id'], user_type='patient'
+        )
+        # Patients only see their own history; compared by pk since request.user may be a ClaimsUser
+        if user.user_type == 'patient' and patient.pk != user.pk:
+            raise PermissionDenied('You do not have permission to perform this action.')
+
+        queryset = PrescriptionHistorySerializer.setup_eager_loading(Prescription.objects.filter(patient=patient))
+        if 'doctor' in filters.validated_data:
+            queryset = queryset.filter(doctor_id=filters.validated_data['doctor'])
+        if filters.validated_data.get('medicine'):
+            queryset = queryset.filter(medicine_name__icontains=filters.validated_data['medicine'])
+        return queryset
@@ -3,6 +3,10 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Only the appointment event stream (/api/appointments/events/) is served over ASGI, by the
+`events` process of the Procfile. The rest of the API stays on the WSGI `web` process: under
+ASGI Django buffers the sync iterators of streaming responses (exports, ID images) in memory.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -60,6 +60,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'rest_framework_simplejwt',
@@ -67,13 +68,15 @@ INSTALLED_APPS = [
     "Prescription",
     "ContactUs",
     "Appointment",
+    "Outbox",
 
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Account.authentication.ClaimsJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
 }
 
 SIMPLE_JWT = {
@@ -90,6 +93,9 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 
 }
+# How ClaimsJWTAuthentication resolves request.user: 'claims', 'cache' or 'db'
+JWT_USER_MODE = config('JWT_USER_MODE', default='claims')
+JWT_USER_CACHE_TTL = config('JWT_USER_CACHE_TTL', default=30, cast=int)
 AUTH_USER_MODEL = 'Account.CustomUser'
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
@@ -121,6 +127,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# Only the appointment event stream (/api/appointments/events/) is served by core.asgi, from the
+# `events` process of the Procfile; the proxy routes that path there and everything else to `web`
+ASGI_APPLICATION = 'core.asgi.application'
 
 DATABASES = {
     'default': {
@@ -138,6 +147,35 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'core.validators.CustomPasswordValidator',
     },
 ]
+
+# Password hashing cost (Account.hashers). New passwords use PASSWORD_HASHER: 'scrypt',
+# 'argon2' (needs argon2-cffi) or 'pbkdf2'. Hashes made with another algorithm or other
+# parameters are upgraded at the user's next login. Size workers with
+# `manage.py benchmark_password_hashers`.
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='scrypt')
+PASSWORD_HASHING = {
+    'scrypt': {
+        'work_factor': config('SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int),
+        'block_size': config('SCRYPT_BLOCK_SIZE', default=8, cast=int),
+        'parallelism': config('SCRYPT_PARALLELISM', default=1, cast=int),
+    },
+    'argon2': {
+        'time_cost': config('ARGON2_TIME_COST', default=2, cast=int),
+        'memory_cost': config('ARGON2_MEMORY_COST', default=102400, cast=int),
+        'parallelism': config('ARGON2_PARALLELISM', default=8, cast=int),
+    },
+    'pbkdf2': {
+        'iterations': config('PBKDF2_ITERATIONS', default=870000, cast=int),
+    },
+}
+_PASSWORD_HASHER_PATHS = {
+    'scrypt': 'Account.hashers.ScryptPasswordHasher',
+    'argon2': 'Account.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'Account.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHER_PATHS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_PATHS.items() if name != PASSWORD_HASHER
+]
 AUTHENTICATION_BACKENDS = [
     'Account.backends.NationalIDBackend',
     'django.contrib.auth.backends.ModelBackend',
@@ -155,6 +193,29 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 
+AVAILABILITY_CACHE_BACKEND = config('AVAILABILITY_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+AVAILABILITY_CACHE = {
+    'BACKEND': AVAILABILITY_CACHE_BACKEND,
+    # e.g. redis://127.0.0.1:6379/1 with django.core.cache.backends.redis.RedisCache
+    'LOCATION': config('AVAILABILITY_CACHE_LOCATION', default='availability'),
+    'TIMEOUT': config('AVAILABILITY_CACHE_TIMEOUT', default=600, cast=int),
+}
+if AVAILABILITY_CACHE_BACKEND.endswith('LocMemCache'):
+    # Least recently used entries are evicted past this size
+    AVAILABILITY_CACHE['OPTIONS'] = {'MAX_ENTRIES': config('AVAILABILITY_CACHE_MAX_ENTRIES', default=10000, cast=int)}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'availability': AVAILABILITY_CACHE,
+}
+AVAILABILITY_CACHE_ALIAS = 'availability'
+# Doctor directory facet counts share the availability cache (a shared backend in production)
+DOCTOR_FACETS_CACHE_ALIAS = config('DOCTOR_FACETS_CACHE_ALIAS', default=AVAILABILITY_CACHE_ALIAS)
+# Broker of the appointment event stream, shared by every process through PostgreSQL LISTEN/NOTIFY
+APPOINTMENT_EVENT_BROKER = config('APPOINTMENT_EVENT_BROKER', default='Appointment.events.PostgresBroker')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -171,4 +232,19 @@ USE_TZ = True
 
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Stream every upload to a temporary file in chunks instead of holding small ones in memory;
+# ID images are moved from there into MEDIA_ROOT without being read into memory whole
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+# Review thumbnails of ID images (Account.images, process_id_images worker)
+ID_THUMBNAIL_SIZE = (640, 640)
+ID_THUMBNAIL_QUALITY = 70
+
+# ID image serving (Account.media): signed URL lifetime, and the web server handing off the
+# transfer: None (Django streams the file), 'x-sendfile' or 'x-accel-redirect' (nginx, with an
+# `internal` location at MEDIA_ACCEL_REDIRECT_LOCATION aliased to MEDIA_ROOT)
+ID_IMAGE_URL_TTL = 3600
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default=None)
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
@@ -0,0 +1,40 @@
+"""
+Fixtures shared by the apps' tests.
+"""
+import shutil
+import tempfile
+from datetime import date
+from django.test import override_settings
+from Account.models import CustomUser
+
+
+def create_user(index, user_type, **extra_fields):
+    """
+    Creates an active user whose unique fields and name are derived from index ('User 001').
+    """
+    extra_fields.setdefault('account_status', 'active')
+    return CustomUser.objects.create_user(
+        national_id=f'{index:014d}',
+        password='Passw0rd!',
+        email=f'user{index}@example.com',
+        phone_number=f'{index:011d}',
+        full_name=f'User {index:03d}',
+        gender='female',
+        birthday=date(1990, 1, 1),
+        address='Cairo',
+        user_type=user_type,
+        **extra_fields
+    )
+
+
+class TemporaryMediaRootMixin:
+    """
+    Stores the files saved by a test in a MEDIA_ROOT of its own, removed afterwards.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
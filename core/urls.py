@@ -29,6 +29,7 @@ from django.urls import path,include
 from django.http import HttpResponse
 from django.conf import settings
 from django.conf.urls.static import static
+from Account.views import serve_id_image
 
 urlpatterns = [
     path('', lambda request: HttpResponse("Welcome to Easy Care API!")),
@@ -37,4 +38,6 @@ urlpatterns = [
     path('api/', include('Prescription.urls')),
     path('api/', include('ContactUs.urls')),
     path('api/appointments/', include('Appointment.urls')),
+    # ID images are never served by static(): only staff and their owner may read them
+    path(f"{settings.MEDIA_URL.lstrip('/')}id_images/<path:path>", serve_id_image, name='id-image'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file